@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 {
     'name': 'Product Configurator Base',
-    'version': '10.0.1.0.0',
+    'version': '10.0.1.1.0',
     'category': 'Generic Modules/Base',
     'summary': 'Base for product configuration interface modules',
     'author': 'Pledra',
@@ -11,8 +11,10 @@
     "data": [
         'data/menu_configurable_product.xml',
         'data/product_attribute.xml',
+        'data/ir_cron.xml',
         'security/configurator_security.xml',
         'security/ir.model.access.csv',
+        'data/ir_actions.xml',
         'views/assets.xml',
         # Désactivé 'views/sale_view.xml',
         'views/product_view.xml',
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tools.sql import column_exists, create_column
+
+
+def migrate(cr, version):
+    """Keep the price of the confirmed sessions: the price of sessions is no
+    longer stored, confirmed sessions show confirmed_price instead"""
+    if not version:
+        return
+    if not column_exists(cr, 'product_config_session', 'price'):
+        return
+    if not column_exists(cr, 'product_config_session', 'confirmed_price'):
+        create_column(
+            cr, 'product_config_session', 'confirmed_price', 'float8')
+    cr.execute("""
+        UPDATE product_config_session
+        SET confirmed_price = price
+        WHERE state = 'done' AND confirmed_price IS NULL
+    """)
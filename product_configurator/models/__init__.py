@@ -3,6 +3,7 @@
 from . import product_config
 from . import product_attribute
 from . import product
+from . import product_pricelist
 from . import res_config_settings
 from . import sale
 from . import stock
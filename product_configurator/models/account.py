@@ -7,3 +7,23 @@ class AccountMoveLine(models.Model):
     _inherit = 'account.move.line'
 
     product_id = fields.Many2one(domain=[('config_ok', '=', False)])
+
+
+class AccountTax(models.Model):
+    _inherit = ['account.tax', 'product.config.price.cache.mixin']
+    _name = 'account.tax'
+
+    def _invalidate_option_prices(self):
+        self.env['product.config.option.price']._invalidate_option_prices(
+            [('product_id.taxes_id', 'in', self.ids)])
+        self.env['product.config.variant.price']._invalidate_variant_prices(
+            [('product_tmpl_id.taxes_id', 'in', self.ids)])
+
+    def write(self, vals):
+        res = super(AccountTax, self).write(vals)
+        self._invalidate_option_prices()
+        return res
+
+    def unlink(self):
+        self._invalidate_option_prices()
+        return super(AccountTax, self).unlink()
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Inverted index of the configuration images of a product.template
+
+The best image of a configuration is the product.config.image sharing the
+most attribute values with it, the first one in sequence order on ties.
+The index maps every attribute value to the images using it so the
+overlap counts of all the images are accumulated in a single pass over
+the selected values, and updated in place when one value changes.
+"""
+
+
+class ConfigImageIndex(object):
+    """Images of a template indexed by attribute value
+
+    :param images: iterable of (image id, value ids) in sequence order
+    """
+
+    __slots__ = ('postings', 'ranks')
+
+    def __init__(self, images):
+        self.postings = {}
+        self.ranks = {}
+        for rank, (image_id, value_ids) in enumerate(images):
+            self.ranks[image_id] = rank
+            for value_id in set(value_ids):
+                self.postings.setdefault(value_id, []).append(image_id)
+
+    def count(self, value_ids):
+        """Return the overlap counts {image id: matches} of the images
+        sharing values with value_ids"""
+        counts = {}
+        self.update(counts, added=value_ids)
+        return counts
+
+    def update(self, counts, added=(), removed=()):
+        """Update counts in place for the values added to and removed from
+        the configuration they were computed for
+
+        :returns: counts
+        """
+        postings = self.postings
+        for value_id in set(added):
+            for image_id in postings.get(value_id, ()):
+                counts[image_id] = counts.get(image_id, 0) + 1
+        for value_id in set(removed):
+            for image_id in postings.get(value_id, ()):
+                counts[image_id] -= 1
+                if not counts[image_id]:
+                    del counts[image_id]
+        return counts
+
+    def best(self, counts):
+        """Return the id of the image with the most matches in counts, the
+        first one in sequence order on ties, or None"""
+        if not counts:
+            return None
+        ranks = self.ranks
+        return min(counts, key=lambda image_id: (
+            -counts[image_id], ranks[image_id]))
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""Bounded LRU cache of configured prices
+
+The cache holds the price dictionaries computed by
+product.template.get_cfg_price_batch() keyed by a fingerprint of the
+configuration and of the pricing context. It is kept in the registry cache,
+so configuration data changes drop it along with the compiled configuration
+rules. Price changes only bump the generation of the prices, see
+product.template._invalidate_price_cache(): every worker empties its cache
+when it sees a new generation. It is shared with the threads prefetching
+prices, see price_prefetch.py.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class ConfigPriceCache(object):
+    """LRU mapping {fingerprint: price dictionary} with usage counters
+
+    :param size: maximum number of prices kept
+    """
+
+    __slots__ = ('size', 'entries', 'hits', 'misses', 'evictions', 'lock',
+                 'generation')
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.RLock()
+        self.generation = None
+
+    @staticmethod
+    def _copy(prices):
+        # Callers append to and format the price dictionaries
+        return dict(prices, vals=list(prices['vals']))
+
+    def __contains__(self, key):
+        """Tell whether key is cached without counting a lookup"""
+        return key in self.entries
+
+    def get(self, key):
+        """Return a copy of the prices cached under key or None"""
+        with self.lock:
+            prices = self.entries.get(key)
+            if prices is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self._copy(prices)
+
+    def sync(self, generation):
+        """Empty the cache and reset its counters when the prices it holds
+        are older than generation"""
+        with self.lock:
+            if self.generation != generation:
+                self.entries.clear()
+                self.hits = self.misses = self.evictions = 0
+                self.generation = generation
+
+    def set(self, key, prices, generation=None):
+        """Cache a copy of prices under key, evicting the least recently
+        used entries beyond the size of the cache. Prices computed for
+        another generation than the one of the cache are not kept"""
+        prices = self._copy(prices)
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.entries[key] = prices
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        """Return the counters of the cache"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self.entries),
+                'hit_ratio': float(self.hits) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""Vectorized evaluation of configured prices
+
+The attribute values of the variants are seen as a sparse 0/1 incidence
+matrix given in coordinate form (one (variant position, option position)
+pair per selected value) so the option totals of all the variants are a
+single sparse matrix-vector product. NumPy is used when available, plain
+Python otherwise.
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def incidence_dot(row_idx, col_idx, vector, nr_rows):
+    """Return the product of the incidence matrix described by row_idx and
+    col_idx with vector
+
+    :param row_idx: list of row positions of the non-zero cells
+    :param col_idx: list of column positions of the non-zero cells
+    :param vector: list of floats indexed by column position
+    :param nr_rows: number of rows of the matrix
+    :returns: list of nr_rows floats
+    """
+    if numpy is not None and row_idx:
+        rows = numpy.asarray(row_idx, dtype=numpy.intp)
+        cols = numpy.asarray(col_idx, dtype=numpy.intp)
+        weights = numpy.asarray(vector, dtype=float)[cols]
+        return numpy.bincount(
+            rows, weights=weights, minlength=nr_rows).tolist()
+    res = [0.0] * nr_rows
+    for row, col in zip(row_idx, col_idx):
+        res[row] += vector[col]
+    return res
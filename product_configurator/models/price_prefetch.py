@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""Background precomputation of configured prices
+
+A PricePrefetcher runs price computations in a small pool of daemon
+threads, each job with its own cursor, so the prices of the configurations
+a user is likely to pick next are in the configured price cache before they
+are asked for. Jobs are submitted once the request which scheduled them is
+committed so they see its writes. The queue is bounded: jobs submitted
+while it is full are dropped and the prices are computed synchronously
+when needed.
+"""
+
+import logging
+import queue
+import threading
+import time
+
+import odoo
+from odoo import api
+
+_logger = logging.getLogger(__name__)
+
+
+class PricePrefetcher(object):
+    """Bounded pool of daemon threads computing configured prices
+
+    :param workers: number of threads
+    :param queue_size: maximum number of jobs waiting
+    """
+
+    def __init__(self, workers, queue_size):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.jobs = queue.Queue(queue_size)
+        self.threads = []
+        for i in range(workers):
+            thread = threading.Thread(
+                target=self._work, name='cfg_price_prefetch_%s' % i)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, dbname, uid, context, tmpl_id, configurations,
+               pricelist_id, time_budget):
+        """Queue the price computation of configurations
+
+        :param configurations: list of (value_ids, custom_values)
+        :param time_budget: seconds after which the job gives up, counted
+                            from the submission
+        :returns: False when the queue is full
+        """
+        try:
+            self.jobs.put_nowait((
+                dbname, uid, context, tmpl_id, configurations, pricelist_id,
+                time.time() + time_budget))
+        except queue.Full:
+            return False
+        return True
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            self._run(*job)
+
+    def _run(self, dbname, uid, context, tmpl_id, configurations,
+             pricelist_id, deadline):
+        try:
+            if time.time() > deadline:
+                return
+            with api.Environment.manage(), \
+                    odoo.registry(dbname).cursor() as cr:
+                env = api.Environment(cr, uid, context)
+                template = env['product.template'].browse(tmpl_id)
+                pricelist = env['product.pricelist'].browse(pricelist_id)
+                template._prefetch_cfg_prices(
+                    configurations, pricelist, deadline)
+        except Exception:
+            _logger.warning(
+                "Configured price prefetch failed for template %s",
+                tmpl_id, exc_info=True)
+
+    def shutdown(self):
+        """Stop the threads once the jobs queued are done"""
+        for thread in self.threads:
+            self.jobs.put(None)
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher(workers, queue_size):
+    """Return the prefetcher of the process, created again when its
+    settings change"""
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None or (
+                _prefetcher.workers, _prefetcher.queue_size) != (
+                workers, queue_size):
+            if _prefetcher is not None:
+                _prefetcher.shutdown()
+            _prefetcher = PricePrefetcher(workers, queue_size)
+        return _prefetcher
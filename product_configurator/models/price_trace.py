@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Opt-in tracing of configured price computations
+
+A PriceTrace records the elapsed time and number of queries of every phase
+of a price computation along with the components priced for every
+configuration. NULL_TRACE is used when tracing is disabled: its methods do
+nothing so the price computation pays a mere method call per phase.
+"""
+
+import time
+
+
+class _Phase(object):
+
+    __slots__ = ('trace', 'name', 'start', 'queries')
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        self.queries = self.trace.cr.sql_log_count
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.trace.phases.append({
+            'name': self.name,
+            'time': time.time() - self.start,
+            'queries': self.trace.cr.sql_log_count - self.queries,
+        })
+
+
+class _NullPhase(object):
+
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+class PriceTrace(object):
+    """Phases and components of a batch of configured price computations
+
+    :param cr: database cursor used to count queries
+    """
+
+    enabled = True
+
+    def __init__(self, cr):
+        self.cr = cr
+        self.phases = []
+        self.components = {}
+
+    def phase(self, name):
+        """Return a context manager timing the phase name"""
+        return _Phase(self, name)
+
+    def add_component(self, index, **component):
+        """Record a component priced for the configuration at index"""
+        self.components.setdefault(index, []).append(component)
+
+    def get_trace(self, index):
+        """Return the trace of the configuration at index"""
+        return {
+            'phases': self.phases,
+            'components': self.components.get(index, []),
+        }
+
+
+class NullTrace(object):
+    """Disabled trace, see PriceTrace"""
+
+    enabled = False
+
+    _phase = _NullPhase()
+
+    def phase(self, name):
+        return self._phase
+
+    def add_component(self, index, **component):
+        pass
+
+
+NULL_TRACE = NullTrace()
@@ -1,16 +1,94 @@
 # -*- coding: utf-8 -*-
 
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict, namedtuple
+
 from odoo.tools.misc import formatLang
 from odoo.exceptions import ValidationError
 from odoo import models, fields, api, tools, _
 from lxml import etree
 
+from .image_index import ConfigImageIndex
+from .price_cache import ConfigPriceCache
+from .price_prefetch import get_prefetcher
+from .price_trace import NULL_TRACE, PriceTrace
+from .rule_engine import (
+    ConfigBitset,
+    ConfigRules,
+    ValueIndex,
+    bit_count,
+    compile_domain,
+    eval_program,
+)
+
+_logger = logging.getLogger(__name__)
+
+# Number of configurations priced between two checks of the time budget of
+# price prefetching
+PREFETCH_CHUNK_SIZE = 20
+
+
+# Immutable snapshots of the configuration metadata of a template returned
+# by product.template._get_configurator_metadata()
+ConfigMetadata = namedtuple('ConfigMetadata', [
+    'tmpl_id',
+    'attribute_lines',
+    'config_line_ids',
+    'config_lines',
+    'config_default_ids',
+    'step_lines',
+    'custom_value_id',
+])
+
+AttributeLineMetadata = namedtuple('AttributeLineMetadata', [
+    'id',
+    'attribute_id',
+    'value_ids',
+    'multi',
+    'required',
+    'custom',
+    'custom_type',
+    'create_on_the_fly',
+    'sequence',
+])
+
+ConfigLineMetadata = namedtuple('ConfigLineMetadata', [
+    'id',
+    'attribute_line_id',
+    'value_ids',
+    'domain_lines',
+])
+
+DomainLineMetadata = namedtuple('DomainLineMetadata', [
+    'id',
+    'attribute_id',
+    'condition',
+    'value_ids',
+])
+
+StepLineMetadata = namedtuple('StepLineMetadata', [
+    'id',
+    'config_step_id',
+    'attribute_line_ids',
+    'sequence',
+])
+
 
 class ProductTemplate(models.Model):
     _inherit = 'product.template'
 
     config_ok = fields.Boolean(string='Can be Configured')
 
+    config_price_display = fields.Boolean(
+        string='Display Configured Price',
+        default=True,
+        help='Compute the price of configuration sessions, prices are not '
+        'computed at all when unchecked'
+    )
+
     config_line_ids = fields.One2many(
         comodel_name='product.config.line',
         inverse_name='product_tmpl_id',
@@ -35,6 +113,11 @@ class ProductTemplate(models.Model):
         string='Configuration Lines'
     )
 
+    def init(self):
+        # Generation of the configured prices, see _invalidate_price_cache()
+        self._cr.execute(
+            'CREATE SEQUENCE IF NOT EXISTS product_config_price_cache_seq')
+
     def flatten_val_ids(self, value_ids):
         """ Return a list of value_ids from a list with a mix of ids
         and list of ids (multiselection)
@@ -68,11 +151,11 @@ class ProductTemplate(models.Model):
         """
 
         open_step_lines = self.env['product.config.step.line']
+        avail_val_ids = self.values_available_bulk(value_ids)
 
         for cfg_line in self.config_step_line_ids:
             for attr_line in cfg_line.attribute_line_ids:
-                available_vals = self.values_available(attr_line.value_ids.ids,
-                                                       value_ids)
+                available_vals = avail_val_ids.get(attr_line.id)
                 # TODO: Refactor when adding restriction to custom values
                 if available_vals or attr_line.custom:
                     open_step_lines |= cfg_line
@@ -138,10 +221,14 @@ class ProductTemplate(models.Model):
 
     
     def get_components_prices(self, prices, value_ids,
-                              custom_values, pricelist):
+                              custom_values, pricelist, tracer=NULL_TRACE):
         """Return prices of the components which make up the final
-        configured variant"""
+        configured variant
+
+        :param tracer: PriceTrace recording the components, see
+                       get_cfg_price_batch()"""
         vals = self._get_option_values(value_ids, pricelist)
+        components = []
         for val in vals:
             prices['vals'].append(
                 (val.attribute_id.name,
@@ -149,23 +236,58 @@ class ProductTemplate(models.Model):
                  val.product_id.price)
             )
             product = val.product_id.with_context({'pricelist': pricelist.id})
-            product_prices = product.taxes_id.sudo().compute_all(
-                price_unit=product.price,
-                currency=pricelist.currency_id,
-                quantity=1,
-                product=self,
-                partner=self.env.user.partner_id
-            )
+            components.append((product.taxes_id.sudo(), product.price, self))
 
+        with tracer.phase('taxes'):
+            tax_results = self._compute_components_taxes(
+                components, pricelist.currency_id)
+        for val, component, product_prices in zip(
+                vals, components, tax_results):
             total_included = product_prices['total_included']
             taxes = total_included - product_prices['total_excluded']
             prices['taxes'] += taxes
             prices['total'] += total_included
+            if tracer.enabled:
+                tracer.add_component(
+                    0, name=val.attribute_id.name, value_id=val.id,
+                    product_id=val.product_id.id, source='pricelist',
+                    price=component[1], pricelist_item_id=False,
+                    total_excluded=product_prices['total_excluded'],
+                    total_included=total_included,
+                    taxes=product_prices['taxes'])
         return prices
 
+    @api.model
+    def _compute_components_taxes(self, components, currency):
+        """Compute the taxes of components, calling compute_all once per
+        distinct (taxes, price, product). Components sharing their taxes
+        are not summed into one call: compute_all rounds the totals of
+        every call under both rounding methods, so the result would differ
+        from the sum of the results per component
+
+        :param components: list of (taxes, price, product)
+        :param currency: res.currency used to round the amounts
+        :returns: list of compute_all results in the order of components
+        """
+        partner = self.env.user.partner_id
+        tax_cache = {}
+        res = []
+        for taxes, price, product in components:
+            key = (taxes, price, product)
+            if key not in tax_cache:
+                tax_cache[key] = taxes.compute_all(
+                    price_unit=price,
+                    currency=currency,
+                    quantity=1,
+                    product=product,
+                    partner=partner
+                )
+            res.append(tax_cache[key])
+        return res
+
     
     def get_cfg_price(self, value_ids, custom_values=None,
-                      pricelist_id=None, formatLang=False):
+                      pricelist_id=None, formatLang=False, trace=False):
         """ Computes the price of the configured product based on the configuration
             passed in via value_ids and custom_values
 
@@ -173,49 +295,475 @@ class ProductTemplate(models.Model):
         :param custom_values: dictionary of custom attribute values
         :param pricelist_id: id of pricelist to use for price computation
         :param formatLang: boolean for formatting price dictionary
+        :param trace: boolean adding the trace of the computation to the
+                      result, see get_cfg_price_batch()
         :returns: dictionary of prices per attribute and total price"""
         self.ensure_one()
-        if custom_values is None:
-            custom_values = {}
-        if not pricelist_id:
+        pricelist = self.env['product.pricelist'].browse(pricelist_id)
+        return self.get_cfg_price_batch(
+            [(self, value_ids, custom_values)],
+            pricelist=pricelist, formatLang=formatLang, trace=trace)[0]
+
+    @api.model
+    def get_cfg_price_batch(self, configurations, pricelist=None,
+                            formatLang=False, trace=False):
+        """ Computes the prices of several configured products at once.
+        Pricelist prices of the templates and option products of all the
+        configurations are resolved with a single call per model and taxes
+        are computed once per distinct (product, taxes, price). Prices are
+        cached under the fingerprint of the configuration and pricing
+        context, see _get_price_cache_key()
+
+        When trace is set the price cache is bypassed and every price
+        dictionary holds a 'trace' entry: {
+            'phases': [{'name': str, 'time': float, 'queries': int}],
+            'components': [{'name', 'value_id', 'product_id', 'source',
+                            'price', 'pricelist_item_id', 'total_excluded',
+                            'total_included', 'taxes'}],
+        }
+
+        :param configurations: list of (template, value_ids, custom_values)
+        :param pricelist: pricelist to use for price computation, defaults
+                          to the pricelist of the user
+        :param formatLang: boolean for formatting price dictionaries
+        :param trace: boolean enabling the trace of the computation
+        :returns: list of price dictionaries as returned by get_cfg_price
+                  in the order of configurations"""
+        if not pricelist:
             pricelist = self.env.user.partner_id.property_product_pricelist
-            pricelist_id = pricelist.id
-        else:
-            pricelist = self.env['product.pricelist'].browse(pricelist_id)
+        tracer = PriceTrace(self.env.cr) if trace else NULL_TRACE
+
+        cache, generation = self._get_current_price_cache()
+        res = []
+        missing = []
+        for template, val_ids, custom_values in configurations:
+            key = self._get_price_cache_key(
+                template, val_ids, custom_values, pricelist)
+            prices = None if trace else cache.get(key)
+            if prices is None:
+                missing.append((len(res), key))
+            res.append(prices)
+
+        if missing:
+            missing_prices = self._compute_cfg_price_batch(
+                [configurations[i] for i, key in missing], pricelist,
+                tracer=tracer)
+            for pos, ((i, key), prices) in enumerate(
+                    zip(missing, missing_prices)):
+                cache.set(key, prices, generation)
+                if trace:
+                    prices['trace'] = tracer.get_trace(pos)
+                res[i] = prices
+
+        if formatLang:
+            res = [
+                template.formatPrices(prices)
+                for (template, val_ids, custom_values), prices
+                in zip(configurations, res)
+            ]
+        return res
+
+    @api.model
+    def _compute_cfg_price_batch(self, configurations, pricelist,
+                                 tracer=NULL_TRACE):
+        """Compute the prices of configurations bypassing the price cache,
+        see get_cfg_price_batch()
 
+        :param tracer: PriceTrace recording the computation
+        """
         currency = pricelist.currency_id
 
-        product = self.with_context({'pricelist': pricelist.id})
+        templates = self.browse()
+        for template, val_ids, custom_values in configurations:
+            templates |= template
+
+        # Options of the attribute lines are read from the option price
+        # table, values outside of the template lines are priced on the fly
+        with tracer.phase('option_table'):
+            option_table = self.env[
+                'product.config.option.price']._get_option_prices(
+                    templates, pricelist)
+        value_ids = set()
+        for template, val_ids, custom_values in configurations:
+            value_ids.update(
+                value_id for value_id in val_ids
+                if (template.id, value_id) not in option_table
+            )
+
+        with tracer.phase('pricelist'):
+            # Only attribute values with products attached have a price
+            values = self.env['product.attribute.value'].sudo().browse(
+                value_ids).filtered('product_id')
+            option_products = values.mapped('product_id')
+
+            def _get_prices(products):
+                if not products:
+                    return {}
+                # {product_id: (price, pricelist item id)}
+                return pricelist._compute_price_rule(list(zip(
+                    products, [1.0] * len(products), [False] * len(products)
+                )))
+
+            tmpl_prices = _get_prices(templates)
+            option_prices = _get_prices(option_products)
+
+        value_map = {value.id: value for value in values}
+
+        # Option table rows hold untaxed prices, their taxes are computed
+        # along with the base prices and the options priced on the fly
+        components = []
+        config_options = []
+        for template, val_ids, custom_values in configurations:
+            components.append((
+                template.taxes_id.sudo(),
+                tmpl_prices.get(template.id, (0.0, False))[0],
+                template
+            ))
+            options = []
+            for value_id in val_ids:
+                row = option_table.get((template.id, value_id))
+                if row is not None:
+                    if not row.price:
+                        continue
+                    value = row.value_id
+                    product = row.product_id
+                    price, item_id = row.price, row.pricelist_item_id.id
+                    source = 'option_table'
+                else:
+                    value = value_map.get(value_id)
+                    if not value:
+                        continue
+                    product = value.product_id
+                    price, item_id = option_prices.get(
+                        product.id, (0.0, False))
+                    if not price:
+                        continue
+                    source = 'pricelist'
+                options.append((value, product, price, item_id, source))
+                components.append((product.taxes_id.sudo(), price, template))
+            config_options.append(options)
+        with tracer.phase('taxes'):
+            tax_results = iter(
+                self._compute_components_taxes(components, currency))
+
+        res = []
+        for i, (template, val_ids, custom_values) in enumerate(
+                configurations):
+            base_prices = next(tax_results)
+            total_included = base_prices['total_included']
+            total_excluded = base_prices['total_excluded']
+
+            prices = {
+                'vals': [
+                    ('Base', template.name, total_excluded)
+                ],
+                'total': total_included,
+                'taxes': total_included - total_excluded,
+                'currency': currency.name
+            }
+            if tracer.enabled:
+                price, item_id = tmpl_prices.get(template.id, (0.0, False))
+                tracer.add_component(
+                    i, name='Base', value_id=False, product_id=False,
+                    source='template', price=price,
+                    pricelist_item_id=item_id,
+                    total_excluded=total_excluded,
+                    total_included=total_included,
+                    taxes=base_prices['taxes'])
+
+            for value, product, price, item_id, source in config_options[i]:
+                prices['vals'].append(
+                    (value.attribute_id.name, product.name, price))
+                product_prices = next(tax_results)
+                total_included = product_prices['total_included']
+                prices['taxes'] += (
+                    total_included - product_prices['total_excluded'])
+                prices['total'] += total_included
+                if tracer.enabled:
+                    tracer.add_component(
+                        i, name=value.attribute_id.name, value_id=value.id,
+                        product_id=product.id, source=source,
+                        price=price, pricelist_item_id=item_id,
+                        total_excluded=product_prices['total_excluded'],
+                        total_included=total_included,
+                        taxes=product_prices['taxes'])
+            res.append(prices)
+        return res
+
+    @api.model
+    @tools.ormcache()
+    def _get_price_cache(self):
+        """Return the LRU cache of configured prices. It lives in the
+        registry cache and is dropped along with it when configuration data
+        change, price changes empty it through _invalidate_price_cache()"""
+        size = self.env['ir.config_parameter'].sudo().get_param(
+            'product_configurator.price_cache_size', 1024)
+        return ConfigPriceCache(int(size))
 
-        base_prices = product.taxes_id.sudo().compute_all(
-            price_unit=product.price,
-            currency=pricelist.currency_id,
-            quantity=1,
-            product=product,
-            partner=self.env.user.partner_id
+    @api.model
+    def _get_current_price_cache(self):
+        """Return the configured price cache emptied of the prices computed
+        before the last price change, and the generation of its prices
+
+        :returns: tuple (ConfigPriceCache, generation)
+        """
+        self.env.cr.execute(
+            'SELECT last_value FROM product_config_price_cache_seq')
+        generation = self.env.cr.fetchone()[0]
+        cache = self._get_price_cache()
+        cache.sync(generation)
+        return cache, generation
+
+    @api.model
+    def _invalidate_price_cache(self):
+        """Drop the configured prices cached by every worker without
+        clearing the rest of the registry cache. The generation of the
+        prices is bumped now for the current transaction and again once it
+        is committed, for the prices computed meanwhile by the other
+        transactions from the data it modified"""
+        cr = self.env.cr
+        cr.execute("SELECT nextval('product_config_price_cache_seq')")
+        if not getattr(cr, 'product_config_price_cache_bump', False):
+            cr.product_config_price_cache_bump = True
+
+            def bump():
+                cr.product_config_price_cache_bump = False
+                cr.execute(
+                    "SELECT nextval('product_config_price_cache_seq')")
+            cr.after('commit', bump)
+
+    @api.model
+    def _get_price_cache_key(self, template, value_ids, custom_values,
+                             pricelist):
+        """Return the fingerprint of a configuration and of the pricing
+        context under which its prices are cached. The language is part of
+        it since the cached component labels are translated"""
+        custom_values = tuple(sorted(
+            (int(attr_id), str(value))
+            for attr_id, value in (custom_values or {}).items()
+        ))
+        partner = self.env.user.partner_id
+        return (
+            template.id,
+            frozenset(value_ids),
+            custom_values,
+            pricelist.id,
+            pricelist.currency_id.id,
+            self.env.company.id,
+            partner.property_account_position_id.id,
+            fields.Date.context_today(self),
+            self.env.lang,
         )
 
-        total_included = base_prices['total_included']
-        total_excluded = base_prices['total_excluded']
+    @api.model
+    def get_price_cache_stats(self):
+        """Return the counters of the configured price cache
 
-        prices = {
-            'vals': [
-                ('Base', self.name, total_excluded)
-            ],
-            'total': total_included,
-            'taxes': total_included - total_excluded,
-            'currency': currency.name
-        }
+        :returns: dictionary {'hits': int, 'misses': int, 'evictions': int,
+                  'size': int, 'hit_ratio': float}
+        """
+        return self._get_price_cache().stats()
+
+    def _get_reachable_configurations(self, value_ids, attr_line_ids=None):
+        """Return the configurations reachable from value_ids by selecting
+        another available value on one attribute line, or adding one on
+        multi lines
+
+        :param value_ids: list of attribute value ids of the configuration
+        :param attr_line_ids: optional list of attribute line ids to restrict
+                              the changes to
+        :returns: list of (attribute line id, value id selected, sorted list
+                  of attribute value ids of the reachable configuration)
+        """
+        self.ensure_one()
+        metadata = self._get_configurator_metadata(self.id)
+        avail_val_ids = self.values_available_bulk(value_ids, attr_line_ids)
+        selected = set(value_ids)
+        res = []
+        for line in metadata.attribute_lines:
+            if line.id not in avail_val_ids:
+                continue
+            line_selected = selected.intersection(line.value_ids)
+            for value_id in avail_val_ids[line.id]:
+                if value_id in line_selected:
+                    continue
+                if line.multi:
+                    reachable_ids = selected | {value_id}
+                else:
+                    reachable_ids = (selected - line_selected) | {value_id}
+                res.append((line.id, value_id, sorted(reachable_ids)))
+        return res
 
-        component_prices = self.get_components_prices(
-            prices, value_ids, custom_values, pricelist)
-        prices.update(component_prices)
+    def get_option_price_deltas(self, value_ids, pricelist=None,
+                                custom_values=None, attr_line_ids=None):
+        """Return the price impact of selecting every available value of the
+        attribute lines given the configuration value_ids. All the
+        configurations are priced in a single batch, see
+        get_cfg_price_batch(), so prefetched prices are reused
 
-        if formatLang:
-            return self.formatPrices(prices)
-        return prices
+        :param value_ids: list of attribute value ids of the configuration
+        :param pricelist: pricelist to use for price computation, defaults
+                          to the pricelist of the user
+        :param custom_values: dictionary of custom attribute values
+        :param attr_line_ids: optional list of attribute line ids to restrict
+                              the deltas to
+        :returns: dictionary {attribute_line_id: {value_id: delta of the
+                  total price}}, 0.0 for the values already selected
+        """
+        self.ensure_one()
+        reachable = self._get_reachable_configurations(
+            value_ids, attr_line_ids)
+        configurations = [(self, value_ids, custom_values)] + [
+            (self, reachable_ids, custom_values)
+            for line_id, value_id, reachable_ids in reachable
+        ]
+        batch_prices = self.get_cfg_price_batch(
+            configurations, pricelist=pricelist)
+        total = batch_prices[0]['total']
+
+        metadata = self._get_configurator_metadata(self.id)
+        selected = set(value_ids)
+        res = {}
+        for line in metadata.attribute_lines:
+            if attr_line_ids is None or line.id in attr_line_ids:
+                res[line.id] = dict.fromkeys(
+                    selected.intersection(line.value_ids), 0.0)
+        for (line_id, value_id, reachable_ids), prices in zip(
+                reachable, batch_prices[1:]):
+            res[line_id][value_id] = prices['total'] - total
+        return res
+
+    def _schedule_price_prefetch(self, value_ids, custom_values=None,
+                                 attr_line_ids=None, pricelist=None):
+        """Compute in the background the prices of the configuration and of
+        the configurations reachable from it, see
+        _get_reachable_configurations(), and store them in the configured
+        price cache.
+
+        The job is submitted once the current transaction is committed and
+        runs with its own cursor, so it sees the committed state of the
+        configuration. The prefetcher is set with the system parameters:
+            product_configurator.price_prefetch_workers: number of threads
+                per process, 0 disables prefetching (default 2)
+            product_configurator.price_prefetch_queue_size: number of jobs
+                waiting per process, further jobs are dropped (default 16)
+            product_configurator.price_prefetch_time_budget: seconds after
+                which a job stops computing prices (default 2.0)
+
+        Prices not prefetched are computed synchronously when read.
+
+        :returns: True when prefetching was scheduled
+        """
+        self.ensure_one()
+        if not self.config_price_display:
+            return False
+        params = self.env['ir.config_parameter'].sudo()
+        workers = int(params.get_param(
+            'product_configurator.price_prefetch_workers', 2))
+        if workers <= 0:
+            return False
+        queue_size = int(params.get_param(
+            'product_configurator.price_prefetch_queue_size', 16))
+        time_budget = float(params.get_param(
+            'product_configurator.price_prefetch_time_budget', 2.0))
+        if not pricelist:
+            pricelist = self.env.user.partner_id.property_product_pricelist
+
+        configurations = [(list(value_ids), custom_values)] + [
+            (reachable_ids, custom_values)
+            for line_id, value_id, reachable_ids
+            in self._get_reachable_configurations(value_ids, attr_line_ids)
+        ]
+
+        prefetcher = None
+        if not getattr(threading.currentThread(), 'testing', False):
+            try:
+                prefetcher = get_prefetcher(workers, queue_size)
+            except Exception:
+                _logger.warning("Configured price prefetcher unavailable",
+                                exc_info=True)
+        if prefetcher is None:
+            # Other cursors do not see the data of the test transaction, and
+            # without threads prices are prefetched in the request
+            try:
+                with self.env.cr.savepoint():
+                    self._prefetch_cfg_prices(
+                        configurations, pricelist, time.time() + time_budget)
+            except Exception:
+                _logger.warning("Configured price prefetch failed",
+                                exc_info=True)
+            return True
+
+        args = (self.env.cr.dbname, self.env.uid, dict(self.env.context),
+                self.id, configurations, pricelist.id, time_budget)
+        self.env.cr.after('commit', lambda: prefetcher.submit(*args))
+        return True
+
+    def _prefetch_cfg_prices(self, configurations, pricelist, deadline):
+        """Compute and cache the prices of the configurations of the
+        template not cached yet, giving up at deadline. Lookups made here
+        are left out of the cache statistics
+
+        :param configurations: list of (value_ids, custom_values)
+        :param pricelist: pricelist to use for price computation
+        :param deadline: time after which no price is computed
+        :returns: number of prices computed
+        """
+        self.ensure_one()
+        # Fetched first so prices computed after an invalidation are not
+        # kept, see ConfigPriceCache.set()
+        cache, generation = self._get_current_price_cache()
+        missing = []
+        for value_ids, custom_values in configurations:
+            key = self._get_price_cache_key(
+                self, value_ids, custom_values, pricelist)
+            if key not in cache:
+                missing.append((key, value_ids, custom_values))
+
+        count = 0
+        for chunk in tools.split_every(PREFETCH_CHUNK_SIZE, missing):
+            if time.time() > deadline:
+                break
+            batch_prices = self._compute_cfg_price_batch([
+                (self, value_ids, custom_values)
+                for key, value_ids, custom_values in chunk
+            ], pricelist)
+            for (key, value_ids, custom_values), prices in zip(
+                    chunk, batch_prices):
+                cache.set(key, prices, generation)
+            count += len(chunk)
+        return count
 
     
+    @api.model
+    def _get_config_fingerprint(self, value_ids, custom_values=None):
+        """Return the canonical hash of a configuration: its sorted value
+        ids and its custom values on searchable attributes. Configurations
+        with custom values on attributes that are not searchable are never
+        matched and have no fingerprint
+
+        :param value_ids: list of product.attribute.values ids
+        :param custom_values: dict {product.attribute.id: custom_value}
+
+        :returns: hexadecimal sha1 digest or False
+        """
+        custom_values = {
+            int(attr_id): value
+            for attr_id, value in (custom_values or {}).items()
+        }
+        attr_obj = self.env['product.attribute']
+        nosearch_fields = attr_obj._get_nosearch_fields()
+        custom_parts = []
+        for attr in attr_obj.browse(sorted(custom_values)):
+            if not attr.search_ok or attr.custom_type in nosearch_fields:
+                return False
+            custom_parts.append('%d=%s' % (attr.id, custom_values[attr.id]))
+        canonical = '%s|%s' % (
+            ','.join(str(value_id) for value_id in sorted(set(value_ids))),
+            ';'.join(custom_parts),
+        )
+        return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
     def search_variant(self, value_ids, custom_values=None):
         """ Searches product.variants with given value_ids and custom values
             given in the custom_values dict
@@ -226,46 +774,31 @@ class ProductTemplate(models.Model):
             :returns: product.product recordset of products matching domain
         """
         self.ensure_one()
-
-        # TODO search finds any match with same 2+ custom attributes
-
-        if custom_values is None:
-            custom_values = {}
-        attr_obj = self.env['product.attribute']
-
-        domain = [('product_tmpl_id', '=', self.id)]
-
-        for value_id in value_ids:
-            domain.append(('attribute_value_ids', '=', value_id))
-
-        attr_search = attr_obj.search([
-            ('search_ok', '=', True),
-            ('custom_type', 'not in', attr_obj._get_nosearch_fields())
+        fingerprint = self._get_config_fingerprint(value_ids, custom_values)
+        if not fingerprint:
+            return self.env['product.product']
+        return self.env['product.product'].search([
+            ('product_tmpl_id', '=', self.id),
+            ('config_fingerprint', '=', fingerprint),
         ])
 
-        for attr_id, value in custom_values.items():
-            if attr_id not in attr_search.ids:
-                domain.append(
-                    ('value_custom_ids.attribute_id', '!=', int(attr_id)))
-            else:
-                domain.append(
-                    ('value_custom_ids.attribute_id', '=', int(attr_id)))
-                domain.append(('value_custom_ids.value', '=', value))
-
-        products = self.env['product.product'].search(domain)
-
-        # At this point, we might have found products with all of the passed
-        # in values, but it might have more attributes!  These are NOT
-        # matches
-        more_attrs = products.filtered(
-            lambda p:
-            len(p.attribute_value_ids) != len(value_ids) or
-            len(p.value_custom_ids) != len(custom_values)
-            )
-        products -= more_attrs
-        return products
+    @api.model
+    @tools.ormcache('tmpl_id')
+    def _get_config_image_index(self, tmpl_id):
+        """Return the configuration images of the template indexed by
+        attribute value. The index is kept in the registry cache and cleared
+        whenever configuration images are modified
+
+        :param tmpl_id: id of the product.template
+        :returns: ConfigImageIndex instance
+        """
+        template = self.browse(tmpl_id).sudo()
+        return ConfigImageIndex(
+            (image.id, image.value_ids.ids)
+            for image in template.config_image_ids
+        )
 
-    def get_config_image_obj(self, value_ids, size=None):
+    def get_config_image_obj(self, value_ids, size=None, custom_values=None):
         """
         Retreive the image object that most closely resembles the configuration
         code sent via value_ids list
@@ -273,20 +806,31 @@ class ProductTemplate(models.Model):
         The default image object is the template (self)
         :param value_ids: a list representing the ids of attribute values
                          (usually stored in the user's session)
+        :param custom_values: optional dict {product.attribute.id:
+                              custom_value}, images using the generic custom
+                              value match configurations with custom values
         :returns: path to the selected image
         """
-        # TODO: Also consider custom values for image change
-        img_obj = self
-        max_matches = 0
         value_ids = self.flatten_val_ids(value_ids)
-        for line in self.config_image_ids:
-            matches = len(set(line.value_ids.ids) & set(value_ids))
-            if matches > max_matches:
-                img_obj = line
-                max_matches = matches
-        return img_obj
+        if custom_values:
+            custom_value_id = self._get_configurator_metadata(
+                self.id).custom_value_id
+            if custom_value_id:
+                value_ids.append(custom_value_id)
+        index = self._get_config_image_index(self.id)
+        image_id = index.best(index.count(value_ids))
+        if not image_id:
+            return self
+        return self.env['product.config.image'].browse(image_id)
+
+    @api.model
+    @tools.ormcache()
+    def _get_binary_attribute_ids(self):
+        """Return the ids of the attributes with binary custom values, kept
+        in the registry cache and cleared when attributes change"""
+        return tuple(self.env['product.attribute'].sudo().search([
+            ('custom_type', '=', 'binary')]).ids)
 
-    
     def encode_custom_values(self, custom_values):
         """ Hook to alter the values of the custom values before creating or writing
 
@@ -295,8 +839,7 @@ class ProductTemplate(models.Model):
             :returns: list of custom values compatible with write and create
         """
         attr_obj = self.env['product.attribute']
-        binary_attribute_ids = attr_obj.search([
-            ('custom_type', '=', 'binary')]).ids
+        binary_attribute_ids = self._get_binary_attribute_ids()
 
         # remove all previous custom values
         custom_lines = [(5, 0, {})]
@@ -326,17 +869,18 @@ class ProductTemplate(models.Model):
          """
         self.ensure_one()
 
-        image = self.get_config_image_obj(value_ids).image
-        all_images = tools.image_get_resized_images(
-            image, avoid_resize_medium=True)
+        # Variants reference the matched configuration image instead of
+        # copying and resizing it, the template image is used otherwise
+        image_obj = self.get_config_image_obj(
+            value_ids, custom_values=custom_values)
+        config_image = self.env['product.config.image']
+        if image_obj._name == config_image._name:
+            config_image = image_obj
         vals = {
             'product_tmpl_id': self.id,
             'attribute_value_ids': [(6, 0, value_ids)],
             'taxes_id': [(6, 0, self.taxes_id.ids)],
-            'image': image,
-            'image_variant': image,
-            'image_medium': all_images['image_medium'],
-            'image_small': all_images['image_medium'],
+            'config_image_id': config_image.id,
         }
 
         if custom_values:
@@ -391,42 +935,299 @@ class ProductTemplate(models.Model):
 
         return variant
 
-    def validate_domains_against_sels(self, domains, sel_val_ids):
+    def create_get_variants(self, configurations):
+        """ Bulk version of create_get_variant(): validates the
+        configurations, retrieves the existing variants with a single
+        fingerprint query and creates the missing ones with a single create
+        call. Identical configurations get the same variant
+
+            :param configurations: list of (value_ids, custom_values) with
+                                   custom_values a dict
+                                   {product.attribute.id: custom_value} or
+                                   None
+
+            :returns: list of product.product records in the order of
+                      configurations
+        """
+        self.ensure_one()
+        binary_attribute_ids = set(self._get_binary_attribute_ids())
+        fingerprints = []
+        for value_ids, custom_values in configurations:
+            custom_values = custom_values or {}
+            valid = self.validate_configuration(value_ids, custom_values)
+            if not valid:
+                raise ValidationError(
+                    _('Invalid Configuration: %s') % (value_ids,))
+            # Configurations with attachments never match, see
+            # create_get_variant()
+            if binary_attribute_ids.intersection(custom_values):
+                fingerprints.append(False)
+            else:
+                fingerprints.append(self._get_config_fingerprint(
+                    value_ids, custom_values))
+
+        product_obj = self.env['product.product']
+        variants = {}
+        if any(fingerprints):
+            for variant in product_obj.search([
+                ('product_tmpl_id', '=', self.id),
+                ('config_fingerprint', 'in', list(filter(None, fingerprints))),
+            ]):
+                variants.setdefault(variant.config_fingerprint, variant)
+
+        # Missing configurations are created once per fingerprint
+        vals_list = []
+        new_keys = []
+        for i, ((value_ids, custom_values), fingerprint) in enumerate(
+                zip(configurations, fingerprints)):
+            key = fingerprint or i
+            if key in variants:
+                continue
+            vals_list.append(self.get_variant_vals(value_ids, custom_values))
+            new_keys.append(key)
+            variants[key] = None
+        if vals_list:
+            # _check_duplicate_product() checks the whole batch at once
+            new_variants = product_obj.create(vals_list)
+            variants.update(zip(new_keys, new_variants))
+
+        return [
+            variants[fingerprint or i]
+            for i, fingerprint in enumerate(fingerprints)
+        ]
+
+    @api.model
+    @tools.ormcache('tmpl_id')
+    def _get_config_rules(self, tmpl_id):
+        """Return the configuration rules of the template compiled to a
+        ConfigRules object. The result is kept in the registry cache and
+        cleared whenever configuration data is modified
+
+        :param tmpl_id: id of the product.template
+        :returns: ConfigRules instance
+        """
+        return self.browse(tmpl_id).sudo()._compile_config_rules()
+
+    @api.model
+    @tools.ormcache('tmpl_id')
+    def _get_configurator_metadata(self, tmpl_id):
+        """Return an immutable snapshot of the static configuration data of
+        the template used by the configurator hot paths. The snapshot is
+        kept in the registry cache and cleared whenever attribute lines,
+        configuration lines, defaults, steps or attributes are modified
+
+        :param tmpl_id: id of the product.template
+        :returns: ConfigMetadata namedtuple
+        """
+        template = self.browse(tmpl_id).sudo()
+        custom_value = self.env.ref(
+            'product_configurator.custom_attribute_value',
+            raise_if_not_found=False
+        )
+        attribute_lines = tuple(
+            AttributeLineMetadata(
+                id=line.id,
+                attribute_id=line.attribute_id.id,
+                value_ids=tuple(line.value_ids.ids),
+                multi=line.multi,
+                required=line.required,
+                custom=line.custom,
+                custom_type=line.attribute_id.custom_type or False,
+                create_on_the_fly=line.attribute_id.create_on_the_fly,
+                sequence=line.sequence,
+            )
+            for line in template.attribute_line_ids.sorted()
+        )
+        config_lines = tuple(
+            ConfigLineMetadata(
+                id=config_line.id,
+                attribute_line_id=config_line.attribute_line_id.id,
+                value_ids=tuple(config_line.value_ids.ids),
+                domain_lines=tuple(
+                    DomainLineMetadata(
+                        id=domain_line.id,
+                        attribute_id=domain_line.attribute_id.id,
+                        condition=domain_line.condition,
+                        value_ids=tuple(domain_line.value_ids.ids),
+                    )
+                    for domain_line in config_line.domain_id.domain_line_ids
+                ),
+            )
+            for config_line in template.config_line_ids
+        )
+        step_lines = tuple(
+            StepLineMetadata(
+                id=step_line.id,
+                config_step_id=step_line.config_step_id.id,
+                attribute_line_ids=tuple(step_line.attribute_line_ids.ids),
+                sequence=step_line.sequence,
+            )
+            for step_line in template.config_step_line_ids
+        )
+        return ConfigMetadata(
+            tmpl_id=tmpl_id,
+            attribute_lines=attribute_lines,
+            config_line_ids=tuple(template.config_line_ids.ids),
+            config_lines=config_lines,
+            config_default_ids=tuple(template.config_default_ids.ids),
+            step_lines=step_lines,
+            custom_value_id=custom_value.id if custom_value else False,
+        )
+
+    def _is_config_priced(self):
+        """Tell whether the prices of the templates make up configured
+        prices: configurable templates and templates of option products"""
+        if any(self.mapped('config_ok')):
+            return True
+        return bool(self.env['product.attribute.value'].sudo().search([
+            ('product_id.product_tmpl_id', 'in', self.ids)
+        ], limit=1))
+
+    def write(self, vals):
+        res = super(ProductTemplate, self).write(vals)
+        # Prices of templates and option products are cached by
+        # configuration, see get_cfg_price_batch()
+        if set(vals) & {'list_price', 'standard_price', 'taxes_id'} and \
+                self._is_config_priced():
+            self._invalidate_price_cache()
+            self.env['product.config.option.price']._invalidate_option_prices(
+                [('product_id.product_tmpl_id', 'in', self.ids)])
+            # Configured variants of the templates and using them as option
+            variant_price_obj = self.env['product.config.variant.price']
+            variant_price_obj._invalidate_variant_prices(['|',
+                ('product_tmpl_id', 'in', self.ids),
+                ('product_id.attribute_value_ids.product_id.product_tmpl_id',
+                 'in', self.ids),
+            ])
+        return res
+
+    def get_config_rules_stats(self):
+        """Return the hit/miss counters of the memoized domain evaluations
+        of the compiled template rules
+
+        :returns: dictionary {'hits': int, 'misses': int, 'size': int}
+        """
+        self.ensure_one()
+        return self._get_config_rules(self.id).stats()
+
+    def _compile_config_rules(self):
+        """Compile config lines and defaults of the template into a
+        ConfigRules object holding only ids"""
+        self.ensure_one()
+        value_domains = defaultdict(set)
+        for line in self.config_line_ids:
+            for value_id in line.value_ids.ids:
+                value_domains[value_id].add(line.domain_id.id)
+
+        domains = self.config_line_ids.mapped('domain_id') | \
+            self.config_default_ids.mapped('domain_id')
+        computed_domains = {
+            domain.id: domain.compute_domain() for domain in domains
+        }
+
+        # Values of the template come first to keep their bits dense
+        value_ids = self.attribute_line_ids.mapped('value_ids').ids
+        value_ids += self.config_line_ids.mapped('value_ids').ids
+        value_ids += self.config_default_ids.mapped('value_ids').ids
+        for computed_domain in computed_domains.values():
+            for token in computed_domain:
+                if isinstance(token, tuple):
+                    value_ids += token[2]
+        index = ValueIndex(OrderedDict.fromkeys(value_ids))
+
+        # Attributes tested by every domain
+        domain_attrs = {
+            domain_id: {
+                token[0] for token in computed_domain
+                if isinstance(token, tuple)
+            }
+            for domain_id, computed_domain in computed_domains.items()
+        }
+
+        # Attribute lines whose availability or defaults depend on each
+        # attribute
+        dependents = defaultdict(set)
+        for line in self.attribute_line_ids:
+            line_val_ids = set(line.value_ids.ids)
+            domain_ids = set()
+            for value_id in line_val_ids:
+                domain_ids |= value_domains.get(value_id, set())
+            for default_line in self.config_default_ids:
+                if line_val_ids & set(default_line.value_ids.ids):
+                    domain_ids.add(default_line.domain_id.id)
+            for domain_id in domain_ids:
+                for attr_id in domain_attrs.get(domain_id, ()):
+                    dependents[attr_id].add(line.id)
+
+        attribute_values = defaultdict(set)
+        for line in self.attribute_line_ids:
+            attribute_values[line.attribute_id.id] |= set(line.value_ids.ids)
+
+        return ConfigRules(
+            index=index,
+            domains={
+                domain_id: compile_domain(computed_domain, index)
+                for domain_id, computed_domain in computed_domains.items()
+            },
+            value_domains={
+                value_id: tuple(domain_ids)
+                for value_id, domain_ids in value_domains.items()
+            },
+            line_values={
+                line.id: tuple(line.value_ids.ids)
+                for line in self.attribute_line_ids
+            },
+            line_attributes={
+                line.id: line.attribute_id.id
+                for line in self.attribute_line_ids
+            },
+            attribute_values={
+                attr_id: frozenset(attr_val_ids)
+                for attr_id, attr_val_ids in attribute_values.items()
+            },
+            dependents={
+                attr_id: frozenset(line_ids)
+                for attr_id, line_ids in dependents.items()
+            }
+        )
+
+    def _get_config_bitset(self, sel_val_ids):
+        """Return the configuration passed via sel_val_ids as a ConfigBitset
+        built on the value index of the compiled template rules. Values
+        unknown to the index are kept on an extended index, no config line
+        restricts them so they are available like in the list based methods
+
+        :param sel_val_ids: ConfigBitset or list of value ids, possibly
+                            holding [6, False, [ids]] commands
+        :returns: ConfigBitset instance
+        """
+        index = self._get_config_rules(self.id).index
+        if isinstance(sel_val_ids, ConfigBitset):
+            if sel_val_ids.index is index:
+                return sel_val_ids
+            sel_val_ids = sel_val_ids.ids()
+        value_ids = self._get_selection_set(sel_val_ids)
+        return index.extend(value_ids).bitset(value_ids)
+
+    def _get_selection_set(self, sel_val_ids):
+        """Return the selected value ids as a set"""
         # must handle both cases in [7, [6, False, []]]
-        flattened = []
+        flattened = set()
         for sel_val_id in sel_val_ids:
             if type(sel_val_id) == list:
-                flattened.extend(sel_val_id[2])
+                flattened.update(sel_val_id[2])
             else:
-                flattened.append(sel_val_id)
+                flattened.add(sel_val_id)
+        return flattened
+
+    def validate_domains_against_sels(self, domains, sel_val_ids):
         # process domains as shown in this wikipedia pseudocode:
         # https://en.wikipedia.org/wiki/Polish_notation#Order_of_operations
-        stack = []
-        for domain in reversed(domains):
-            if type(domain) == tuple:
-                # evaluate operand and push to stack
-                if domain[1] == 'in':
-                    if not set(domain[2]) & set(flattened):
-                        stack.append(False)
-                        continue
-                else:
-                    if set(domain[2]) & set(flattened):
-                        stack.append(False)
-                        continue
-                stack.append(True)
-            else:
-                # evaluate operator and previous 2 operands
-                # compute_domain() only inserts 'or' operators
-                # compute_domain() enforces 2 operands per operator
-                operand1 = stack.pop()
-                operand2 = stack.pop()
-                stack.append(operand1 or operand2)
-
-        # 'and' operator is implied for remaining stack elements
-        avail = True
-        while stack:
-            avail &= stack.pop()
-        return avail
+        if isinstance(sel_val_ids, ConfigBitset):
+            return eval_program(
+                compile_domain(domains, sel_val_ids.index), sel_val_ids.bits)
+        return eval_program(
+            compile_domain(domains), self._get_selection_set(sel_val_ids))
 
     
     def values_available(self, attr_val_ids, sel_val_ids):
@@ -434,36 +1235,48 @@ class ProductTemplate(models.Model):
         are available for selection given the configuration ids and the
         dependencies set on the product template
 
-        :param attr_val_ids: list of attribute value ids to check for
-                             availability
-        :param sel_val_ids: list of attribute value ids already selected
+        :param attr_val_ids: list or ConfigBitset of attribute value ids
+                             to check for availability
+        :param sel_val_ids: list or ConfigBitset of attribute value ids
+                            already selected
 
-        :returns: list of available attribute values
+        :returns: list of available attribute values or a ConfigBitset
+                  when attr_val_ids is a ConfigBitset
         """
-
-        avail_val_ids = []
-        for attr_val_id in attr_val_ids:
-
-            config_lines = self.config_line_ids.filtered(
-                lambda l: attr_val_id in l.value_ids.ids
-            )
-            domains = config_lines.mapped('domain_id').compute_domain()
-
-            avail = self.validate_domains_against_sels(domains, sel_val_ids)
-            if avail:
-                avail_val_ids.append(attr_val_id)
-
-        return avail_val_ids
-
+        rules = self._get_config_rules(self.id)
+        selection = self._get_config_bitset(sel_val_ids).bits
+        if isinstance(attr_val_ids, ConfigBitset):
+            candidates = self._get_config_bitset(attr_val_ids)
+            return ConfigBitset(
+                candidates.index,
+                rules.available_bits(candidates.bits, selection))
+        return rules.values_available(attr_val_ids, selection)
+
+    def values_available_bulk(self, sel_val_ids, attr_line_ids=None):
+        """Determines the available values of every attribute line of the
+        template in a single pass given the configuration ids
+
+        :param sel_val_ids: list or ConfigBitset of attribute value ids
+                            already selected
+        :param attr_line_ids: optional list of attribute line ids to restrict
+                              the evaluation to
+
+        :returns: dictionary {attribute_line_id: [available value ids]}
+        """
+        self.ensure_one()
+        rules = self._get_config_rules(self.id)
+        selection = self._get_config_bitset(sel_val_ids).bits
+        return rules.values_available_bulk(selection, attr_line_ids)
     
     def find_default_value(self, selectable_value_ids, value_ids):
         """Based on the current values, which of the available template value ids
             is the best default value to use.
 
-            :param selectable_value_ids: list of product.attribute.value
-                object already trimmed down as selectable, for one
-                attribute line.
-            :param value_ids: list of attribute value ids already chosen
+            :param selectable_value_ids: list or ConfigBitset of
+                product.attribute.value ids already trimmed down as
+                selectable, for one attribute line.
+            :param value_ids: list or ConfigBitset of attribute value ids
+                already chosen
 
             :returns: The first matched default (id, display_name)
 
@@ -472,17 +1285,19 @@ class ProductTemplate(models.Model):
 
         if not selectable_value_ids:
             return False
+        rules = self._get_config_rules(self.id)
+        selectable = self._get_config_bitset(selectable_value_ids)
+        selection = self._get_config_bitset(value_ids).bits
         # assume all values are from the same attribute line - they should be!
         default_lines = self.config_default_ids.filtered(
-            lambda l: set(l.value_ids.ids) & set(selectable_value_ids)
+            lambda l: rules.index.mask(l.value_ids.ids) & selectable.bits
         )
 
         for default_line in default_lines:
             if not default_line.domain_id:
                 # No domain - always considered true. Use this.
                 break
-            domains = default_line.mapped('domain_id').compute_domain()
-            if self.validate_domains_against_sels(domains, value_ids):
+            if rules.eval_domain(default_line.domain_id.id, selection):
                 # Domain OK, use this
                 break
         else:
@@ -492,18 +1307,15 @@ class ProductTemplate(models.Model):
         return next(
             ((value_id.id, value_id.display_name)
                 for value_id in default_line.value_ids
-                if value_id.id in selectable_value_ids),
+                if value_id.id in selectable),
             False)
-        return (
-            set(default_line.value_ids.ids) & set(selectable_value_ids)
-        ).pop()
 
     
     def validate_configuration(self, value_ids, custom_vals=None, final=True):
         """ Verifies if the configuration values passed via value_ids and custom_vals
         are valid
 
-        :param value_ids: list of attribute value ids
+        :param value_ids: list or ConfigBitset of attribute value ids
         :param custom_vals: custom values dict {attr_id: custom_val}
         :param final: boolean marker to check required attributes.
                       pass false to check non-final configurations
@@ -516,21 +1328,27 @@ class ProductTemplate(models.Model):
         if custom_vals is None:
             custom_vals = {}
 
+        rules = self._get_config_rules(self.id)
+        selection = self._get_config_bitset(value_ids).bits
+        line_masks = {
+            line: rules.index.mask(line.value_ids.ids)
+            for line in self.attribute_line_ids
+        }
+
         for line in self.attribute_line_ids:
             # Validate custom values
             attr = line.attribute_id
             if attr.id in custom_vals:
                 attr.validate_custom_val(custom_vals[attr.id])
             if final:
-                common_vals = set(value_ids) & set(line.value_ids.ids)
+                common_vals = selection & line_masks[line]
                 custom_val = custom_vals.get(attr.id)
                 if line.required and not common_vals and not custom_val:
                     # TODO: Verify custom value type to be correct
                     return False
 
         # Check if all all the values passed are not restricted
-        avail_val_ids = self.values_available(value_ids, value_ids)
-        if set(value_ids) - set(avail_val_ids):
+        if rules.available_bits(selection, selection) != selection:
             return False
 
         # Check if custom values are allowed
@@ -545,7 +1363,7 @@ class ProductTemplate(models.Model):
             lambda l: not l.multi)
 
         for line in mono_attr_lines:
-            if len(set(line.value_ids.ids) & set(value_ids)) > 1:
+            if bit_count(selection & line_masks[line]) > 1:
                 return False
         return True
 
@@ -588,6 +1406,72 @@ class ProductProduct(models.Model):
     _inherit = 'product.product'
     _rec_name = 'config_name'
 
+    def write(self, vals):
+        res = super(ProductProduct, self).write(vals)
+        variant_price_obj = self.env['product.config.variant.price']
+        # Cost based pricelist rules use the price of the variants, stock
+        # valuation writes it on every move of the other products
+        if 'standard_price' in vals and self._is_config_priced():
+            self.env['product.template']._invalidate_price_cache()
+            self.env['product.config.option.price']._invalidate_option_prices(
+                [('product_id', 'in', self.ids)])
+            variant_price_obj._invalidate_variant_prices([
+                ('product_id.attribute_value_ids.product_id', 'in', self.ids)
+            ])
+        # Stored prices follow the configuration of the variants
+        if set(vals) & {'attribute_value_ids', 'value_custom_ids'}:
+            variant_price_obj._invalidate_variant_prices(
+                [('product_id', 'in', self.ids)])
+        return res
+
+    def _is_config_priced(self):
+        """Tell whether the prices of the variants make up configured
+        prices: configurable variants and option products"""
+        if any(self.mapped('config_ok')):
+            return True
+        return bool(self.env['product.attribute.value'].sudo().search([
+            ('product_id', 'in', self.ids)
+        ], limit=1))
+
+    def _assign_config_images(self, field_name, image_field_name):
+        """Set field_name of the variants showing their configuration image
+        to its image_field_name and return the other variants"""
+        config_products = self.filtered(
+            lambda p: p.config_image_id and not p.image_variant_1920)
+        for product in config_products:
+            product[field_name] = product.config_image_id[image_field_name]
+        return self - config_products
+
+    @api.depends('image_variant_1920', 'product_tmpl_id.image_1920',
+                 'config_image_id.image')
+    def _compute_image_1920(self):
+        products = self._assign_config_images('image_1920', 'image')
+        super(ProductProduct, products)._compute_image_1920()
+
+    @api.depends('image_variant_1024', 'product_tmpl_id.image_1024',
+                 'config_image_id.image_1024')
+    def _compute_image_1024(self):
+        products = self._assign_config_images('image_1024', 'image_1024')
+        super(ProductProduct, products)._compute_image_1024()
+
+    @api.depends('image_variant_512', 'product_tmpl_id.image_512',
+                 'config_image_id.image_512')
+    def _compute_image_512(self):
+        products = self._assign_config_images('image_512', 'image_512')
+        super(ProductProduct, products)._compute_image_512()
+
+    @api.depends('image_variant_256', 'product_tmpl_id.image_256',
+                 'config_image_id.image_256')
+    def _compute_image_256(self):
+        products = self._assign_config_images('image_256', 'image_256')
+        super(ProductProduct, products)._compute_image_256()
+
+    @api.depends('image_variant_128', 'product_tmpl_id.image_128',
+                 'config_image_id.image_128')
+    def _compute_image_128(self):
+        products = self._assign_config_images('image_128', 'image_128')
+        super(ProductProduct, products)._compute_image_128()
+
     def _get_conversions_dict(self):
         conversions = {
             'float': float,
@@ -595,34 +1479,71 @@ class ProductProduct(models.Model):
         }
         return conversions
 
-    @api.constrains('attribute_value_ids')
-    def _check_duplicate_product(self):
-        if not self.config_ok:
-            return None
-
-        # At the moment, I don't have enough confidence with my understanding
-        # of binary attributes, so will leave these as not matching...
-        # In theory, they should just work, if they are set to "non search"
-        # in custom field def!
-        # TODO: Check the logic with binary attributes
-        if self.value_custom_ids.filtered(lambda cv: cv.attachment_ids):
-            pass
-        else:
+    def init(self):
+        # Fingerprint lookups of search_variant(). The index is not unique:
+        # it is created before the fingerprints of existing variants are
+        # computed, duplicates are refused by _check_duplicate_product()
+        self._cr.execute("""
+            CREATE INDEX IF NOT EXISTS product_product_config_fingerprint_index
+            ON product_product (product_tmpl_id, config_fingerprint)
+            WHERE config_fingerprint IS NOT NULL AND active
+        """)
+
+    @api.depends('config_ok', 'attribute_value_ids',
+                 'value_custom_ids.value', 'value_custom_ids.attribute_id',
+                 'value_custom_ids.attachment_ids',
+                 'value_custom_ids.attribute_id.search_ok',
+                 'value_custom_ids.attribute_id.custom_type')
+    def _compute_config_fingerprint(self):
+        tmpl_obj = self.env['product.template']
+        for product in self:
+            # Variants with attachments never match, see create_get_variant
+            if not product.config_ok or product.value_custom_ids.filtered(
+                    lambda cv: cv.attachment_ids):
+                product.config_fingerprint = False
+                continue
             custom_values = {
                 cv.attribute_id.id: cv.value
-                for cv in self.value_custom_ids
-                }
+                for cv in product.value_custom_ids
+            }
+            product.config_fingerprint = tmpl_obj._get_config_fingerprint(
+                product.attribute_value_ids.ids, custom_values)
 
-            duplicates = self.product_tmpl_id.search_variant(
-                self.attribute_value_ids.ids,
-                custom_values=custom_values
-                ).filtered(lambda p: p.id != self.id)
-
-            if duplicates:
-                raise ValidationError(
-                    _("Configurable Products cannot have duplicates "
-                      "(identical attribute values)")
-                )
+    @api.constrains('attribute_value_ids', 'value_custom_ids', 'active')
+    def _check_duplicate_product(self):
+        """Refuse active configured variants sharing the configuration of
+        another active variant of their template, among the records checked
+        and against the database in a single query. Variants with custom
+        values on binary or non searchable attributes have no fingerprint
+        and are not checked"""
+        products = self.filtered(
+            lambda p: p.config_ok and p.active and p.config_fingerprint)
+        if not products:
+            return
+        keys = set()
+        duplicate = False
+        for product in products:
+            key = (product.product_tmpl_id.id, product.config_fingerprint)
+            if key in keys:
+                duplicate = True
+                break
+            keys.add(key)
+        if not duplicate:
+            # Matched against the other variants on the (template,
+            # fingerprint) pairs in a single query
+            self.flush(['product_tmpl_id', 'config_fingerprint', 'active'])
+            self._cr.execute("""
+                SELECT id FROM product_product
+                WHERE (product_tmpl_id, config_fingerprint) IN %s
+                    AND id NOT IN %s AND active
+                LIMIT 1
+            """, (tuple(keys), tuple(products.ids)))
+            duplicate = bool(self._cr.fetchone())
+        if duplicate:
+            raise ValidationError(
+                _("Configurable Products cannot have duplicates "
+                  "(identical attribute values)")
+            )
 
     def _compute_product_price_extra(self):
         """Compute price of configurable products as sum
@@ -630,11 +1551,26 @@ class ProductProduct(models.Model):
         products = self.filtered(lambda x: not x.config_ok)
         configurable_products = self - products
         if products:
-            prices = super(ProductProduct, self)._compute_product_price_extra()
+            super(ProductProduct, products)._compute_product_price_extra()
+        if not configurable_products:
+            return
+
+        # Prices of the variants repriced in bulk today, the cfg_price_trace
+        # context key recomputes and logs the prices instead
+        pricelist = self.env.user.partner_id.property_product_pricelist
+        trace = self.env.context.get('cfg_price_trace', False)
+        stored_prices = {}
+        if not trace:
+            stored_prices = self.env[
+                'product.config.variant.price']._get_variant_prices(
+                    configurable_products, pricelist)
 
         conversions = self._get_conversions_dict()
+        configurations = []
         for product in configurable_products:
-            lst_price = product.product_tmpl_id.lst_price
+            if product.id in stored_prices:
+                product.price_extra = stored_prices[product.id]
+                continue
             value_ids = product.attribute_value_ids.ids
             # TODO: Merge custom values from products with cfg session
             # and use same method to retrieve parsed custom val dict
@@ -654,8 +1590,21 @@ class ProductProduct(models.Model):
                         )
                 else:
                     custom_vals[val.attribute_id.id] = val.value
-            prices = product.product_tmpl_id.get_cfg_price(
-                value_ids, custom_vals)
+            configurations.append(
+                (product.product_tmpl_id, value_ids, custom_vals))
+
+        if not configurations:
+            return
+        batch_prices = self.env['product.template'].get_cfg_price_batch(
+            configurations, pricelist=pricelist, trace=trace)
+        for (template, value_ids, custom_vals), product, prices in zip(
+                configurations, configurable_products.filtered(
+                    lambda p: p.id not in stored_prices), batch_prices):
+            if trace:
+                _logger.info(
+                    "Price trace of %s: %s", product.display_name,
+                    prices.pop('trace'))
+            lst_price = template.lst_price
             product.price_extra = prices['total'] - prices['taxes'] - lst_price
 
     config_name = fields.Char(
@@ -669,6 +1618,23 @@ class ProductProduct(models.Model):
         string='Custom Values',
         readonly=True,
     )
+    config_image_id = fields.Many2one(
+        comodel_name='product.config.image',
+        string='Configuration Image',
+        ondelete='set null',
+        readonly=True,
+        help='Image of the template matching the configuration, shown when '
+        'the variant has no image of its own'
+    )
+    # Indexed with the template by a partial index, see init()
+    config_fingerprint = fields.Char(
+        string='Configuration Fingerprint',
+        compute='_compute_config_fingerprint',
+        store=True,
+        copy=False,
+        help='Hash of the attribute values and searchable custom values of '
+        'configured variants used to find identical configurations'
+    )
 
     def _check_attribute_value_ids(self):
         """ Removing multi contraint attribute to enable multi selection. """
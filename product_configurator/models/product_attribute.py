@@ -8,7 +8,8 @@ from ast import literal_eval
 
 
 class ProductAttribute(models.Model):
-    _inherit = 'product.attribute'
+    _inherit = ['product.attribute', 'product.config.cache.mixin']
+    _name = 'product.attribute'
 
     
     def copy(self, default=None):
@@ -136,7 +137,11 @@ class ProductAttribute(models.Model):
 
 
 class ProductAttributeLine(models.Model):
-    _inherit = 'product.template.attribute.line'
+    _inherit = [
+        'product.template.attribute.line',
+        'product.config.cache.mixin',
+    ]
+    _name = 'product.template.attribute.line'
 
     @api.onchange('attribute_id')
     def onchange_attribute(self):
@@ -199,6 +204,28 @@ class ProductAttributeValue(models.Model):
             record = super(ProductAttributeValue, self).create(vals)
         return record
 
+    def write(self, vals):
+        res = super(ProductAttributeValue, self).write(vals)
+        # Option products make up the configured prices
+        if 'product_id' in vals:
+            self.env['product.template']._invalidate_price_cache()
+            self.env['product.config.option.price']._invalidate_option_prices(
+                [('value_id', 'in', self.ids)])
+            variant_price_obj = self.env['product.config.variant.price']
+            variant_price_obj._invalidate_variant_prices(
+                [('product_id.attribute_value_ids', 'in', self.ids)])
+        return res
+
+    def unlink(self):
+        priced = any(self.mapped('product_id'))
+        # Stored prices of the templates offering the values
+        self.env['product.config.variant.price']._invalidate_variant_prices(
+            [('product_tmpl_id.attribute_line_ids.value_ids', 'in', self.ids)])
+        res = super(ProductAttributeValue, self).unlink()
+        if priced:
+            self.clear_caches()
+        return res
+
     
     def copy(self, default=None):
         default.update({'name': self.name + " (copy)"})
@@ -228,7 +255,6 @@ class ProductAttributeValue(models.Model):
         if product_tmpl_id:
             # TODO: Avoiding browse here could be a good performance enhancer
             product_tmpl = self.env['product.template'].browse(product_tmpl_id)
-            tmpl_vals = product_tmpl.attribute_line_ids.mapped('value_ids')
             attr_restrict_ids = []
             preset_val_ids = []
             new_args = []
@@ -239,11 +265,13 @@ class ProductAttributeValue(models.Model):
                     # TODO: Check if all values are available for configuration
                 else:
                     new_args.append(arg)
-            val_ids = set(tmpl_vals.ids)
-            if preset_val_ids:
-                val_ids -= set(arg[2])
-            val_ids = product_tmpl.values_available(
-                val_ids, preset_val_ids)
+            avail_val_ids = product_tmpl.values_available_bulk(
+                preset_val_ids)
+            preset_val_set = set(preset_val_ids)
+            val_ids = [
+                val_id for line_val_ids in avail_val_ids.values()
+                for val_id in line_val_ids if val_id not in preset_val_set
+            ]
             new_args.append(('id', 'in', val_ids))
             mono_tmpl_lines = product_tmpl.attribute_line_ids.filtered(
                 lambda l: not l.multi)
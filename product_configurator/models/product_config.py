@@ -1,28 +1,137 @@
 # -*- coding: utf-8 -*-
 
-from odoo import models, fields, api, _
+import logging
+
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import Warning, ValidationError
 from ast import literal_eval
 
+from .price_engine import incidence_dot
+
+_logger = logging.getLogger(__name__)
+
+
+class ProductConfigCacheMixin(models.AbstractModel):
+    """Clear the compiled configuration rules, metadata and configured
+    prices kept in the registry cache whenever configuration data is
+    created, modified or removed. Clearing the registry cache is signaled
+    to the other workers at the end of the request"""
+    _name = 'product.config.cache.mixin'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super(ProductConfigCacheMixin, self).create(vals_list)
+        self.clear_caches()
+        return records
+
+    def write(self, vals):
+        res = super(ProductConfigCacheMixin, self).write(vals)
+        self.clear_caches()
+        return res
+
+    def unlink(self):
+        res = super(ProductConfigCacheMixin, self).unlink()
+        self.clear_caches()
+        return res
+
+
+class ProductConfigPriceCacheMixin(models.AbstractModel):
+    """Drop the configured prices cached by every worker whenever pricing
+    data is created, modified or removed, leaving the rest of the registry
+    cache alone, see product.template._invalidate_price_cache()"""
+    _name = 'product.config.price.cache.mixin'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super(ProductConfigPriceCacheMixin, self).create(vals_list)
+        self.env['product.template']._invalidate_price_cache()
+        return records
+
+    def write(self, vals):
+        res = super(ProductConfigPriceCacheMixin, self).write(vals)
+        self.env['product.template']._invalidate_price_cache()
+        return res
+
+    def unlink(self):
+        res = super(ProductConfigPriceCacheMixin, self).unlink()
+        self.env['product.template']._invalidate_price_cache()
+        return res
+
 
 class ProductConfigDomain(models.Model):
     _name = 'product.config.domain'
+    _inherit = ['product.config.cache.mixin']
 
     
     @api.depends('implied_ids')
     def _get_trans_implied(self):
         "Computes the transitive closure of relation implied_ids"
+        for domain in self:
+            domain.trans_implied_ids = domain._get_implied_closure()
+
+    def _get_implied_closure(self):
+        """Return the domains transitively implied by self (self included).
+        The graph is walked iteratively one level at a time so cycles in
+        implied_ids cannot cause an infinite recursion"""
+        closure = self
+        todo = self
+        while todo:
+            implied = todo.mapped('implied_ids') - closure
+            closure |= implied
+            todo = implied
+        return closure
+
+    def _get_implying_domains(self):
+        """Return the domains other than self whose stored transitive
+        closure includes any domain of self"""
+        return self.search([
+            ('trans_implied_ids', 'in', self.ids),
+            ('id', 'not in', self.ids)
+        ])
 
-        def linearize(domains):
-            trans_domains = domains
-            for domain in domains:
-                implied_domains = domain.implied_ids - domain
-                if implied_domains:
-                    trans_domains |= linearize(implied_domains)
-            return trans_domains
+    def write(self, vals):
+        res = super(ProductConfigDomain, self).write(vals)
+        if 'implied_ids' in vals:
+            # The closure of the domains implying self changed as well
+            self._get_implying_domains().modified(['implied_ids'])
+        return res
 
-        for domain in self:
-            domain.trans_implied_ids = linearize(domain)
+    def unlink(self):
+        implying_domains = self._get_implying_domains()
+        res = super(ProductConfigDomain, self).unlink()
+        implying_domains.exists().modified(['implied_ids'])
+        return res
+
+    @api.model
+    @tools.ormcache('domain_id')
+    def _get_computed_domain(self, domain_id):
+        """Return the flattened domain lines of domain_id and all the domains
+        it transitively implies, kept in the registry cache
+
+        :param domain_id: id of the product.config.domain
+        :returns: tuple of '|' operators and
+                  (attr_id, condition, tuple of value_ids) tuples
+        """
+        domain = self.browse(domain_id).sudo()
+        lines = domain.trans_implied_ids.mapped('domain_line_ids').sorted()
+        if not lines:
+            return ()
+        computed_domain = []
+        for line in lines[:-1]:
+            if line.operator == 'or':
+                computed_domain.append('|')
+            computed_domain.append(
+                (line.attribute_id.id,
+                 line.condition,
+                 tuple(line.value_ids.ids))
+            )
+        # ensure 2 operands follow the last operator
+        computed_domain.append(
+            (lines[-1].attribute_id.id,
+             lines[-1].condition,
+             tuple(lines[-1].value_ids.ids))
+        )
+        return tuple(computed_domain)
 
     
     def compute_domain(self):
@@ -30,24 +139,12 @@ class ProductConfigDomain(models.Model):
             and all implied_ids"""
         # TODO: Enable the usage of OR operators between implied_ids
         # TODO: Add implied_ids sequence field to enforce order of operations
-        # TODO: Prevent circular dependencies
         computed_domain = []
         for domain in self:
-            lines = domain.trans_implied_ids.mapped('domain_line_ids').sorted()
-            for line in lines[:-1]:
-                if line.operator == 'or':
-                    computed_domain.append('|')
-                computed_domain.append(
-                    (line.attribute_id.id,
-                     line.condition,
-                     line.value_ids.ids)
-                )
-            # ensure 2 operands follow the last operator
-            computed_domain.append(
-                (lines[-1].attribute_id.id,
-                 lines[-1].condition,
-                 lines[-1].value_ids.ids)
-            )
+            for token in self._get_computed_domain(domain.id):
+                if isinstance(token, tuple):
+                    token = (token[0], token[1], list(token[2]))
+                computed_domain.append(token)
         return computed_domain
 
     name = fields.Char(
@@ -71,6 +168,8 @@ class ProductConfigDomain(models.Model):
     trans_implied_ids = fields.Many2many(
         comodel_name='product.config.domain',
         compute=_get_trans_implied,
+        store=True,
+        relation='product_config_domain_trans_implied_rel',
         column1='domain_id',
         column2='parent_id',
         string='Transitively inherits'
@@ -79,6 +178,7 @@ class ProductConfigDomain(models.Model):
 
 class ProductConfigDomainLine(models.Model):
     _name = 'product.config.domain.line'
+    _inherit = ['product.config.cache.mixin']
     _order = 'sequence'
 
     def _get_domain_conditions(self):
@@ -137,6 +237,7 @@ class ProductConfigDomainLine(models.Model):
 
 class ProductConfigLine(models.Model):
     _name = 'product.config.line'
+    _inherit = ['product.config.cache.mixin']
 
     # TODO: Prevent config lines having dependencies that are not set in other
     # config lines
@@ -199,6 +300,7 @@ class ProductConfigLine(models.Model):
 
 class ProductConfigDefault(models.Model):
     _name = 'product.config.default'
+    _inherit = ['product.config.cache.mixin']
 
     product_tmpl_id = fields.Many2one(
         comodel_name='product.template',
@@ -252,6 +354,7 @@ class ProductConfigDefault(models.Model):
 
 class ProductConfigImage(models.Model):
     _name = 'product.config.image'
+    _inherit = ['product.config.cache.mixin']
 
     name = fields.Char('Name', size=128, required=True, translate=True)
 
@@ -262,7 +365,22 @@ class ProductConfigImage(models.Model):
         required=True
     )
 
-    image = fields.Binary('Image', required=True)
+    image = fields.Image(
+        'Image', required=True, max_width=1920, max_height=1920)
+    # Resized once per configuration image and shared by all the variants
+    # using it, see product.product.config_image_id
+    image_1024 = fields.Image(
+        'Image 1024', related='image', max_width=1024, max_height=1024,
+        store=True)
+    image_512 = fields.Image(
+        'Image 512', related='image', max_width=512, max_height=512,
+        store=True)
+    image_256 = fields.Image(
+        'Image 256', related='image', max_width=256, max_height=256,
+        store=True)
+    image_128 = fields.Image(
+        'Image 128', related='image', max_width=128, max_height=128,
+        store=True)
 
     sequence = fields.Integer(string='Sequence', default=10)
 
@@ -302,6 +420,7 @@ class ProductConfigStep(models.Model):
 
 class ProductConfigStepLine(models.Model):
     _name = 'product.config.step.line'
+    _inherit = ['product.config.cache.mixin']
 
     name = fields.Char(related='config_step_id.name')
 
@@ -343,14 +462,35 @@ class ProductConfigSession(models.Model):
     _name = 'product.config.session'
 
     
-    @api.depends('value_ids', 'custom_value_ids', 'custom_value_ids.value')
+    @api.depends('value_ids', 'custom_value_ids', 'custom_value_ids.value',
+                 'state', 'confirmed_price')
     def _compute_cfg_price(self):
+        """The price of draft sessions is only computed when read, confirmed
+        sessions show the price stored by action_confirm"""
         for session in self:
-            if session.product_tmpl_id:
-                custom_vals = session._get_custom_vals_dict()
-                price = session.product_tmpl_id.get_cfg_price(
-                    session.value_ids.ids, custom_vals)
-                session.price = price['total']
+            if session.state == 'done':
+                session.price = session.confirmed_price
+            else:
+                session.price = session._get_cfg_price()
+
+    def _get_cfg_price(self):
+        """Return the total price of the configuration, 0 when the template
+        does not display configured prices"""
+        self.ensure_one()
+        template = self.product_tmpl_id
+        if not template or not template.config_price_display:
+            return 0.0
+        custom_vals = self._get_custom_vals_dict()
+        price = template.get_cfg_price(self.value_ids.ids, custom_vals)
+        return price['total']
+
+    def get_cfg_price_trace(self):
+        """Return the prices of the configuration along with the trace of
+        their computation, see product.template.get_cfg_price_batch()"""
+        self.ensure_one()
+        custom_vals = self._get_custom_vals_dict()
+        return self.product_tmpl_id.get_cfg_price(
+            self.value_ids.ids, custom_vals, trace=True)
 
     
     def _get_custom_vals_dict(self):
@@ -390,7 +530,11 @@ class ProductConfigSession(models.Model):
     price = fields.Float(
         compute='_compute_cfg_price',
         string='Price',
-        store=True,
+    )
+    confirmed_price = fields.Float(
+        string='Confirmed Price',
+        readonly=True,
+        copy=False,
     )
     state = fields.Selection(
         string='State',
@@ -412,7 +556,10 @@ class ProductConfigSession(models.Model):
         valid = self.product_tmpl_id.validate_configuration(
             self.value_ids.ids, custom_val_dict)
         if valid:
-            self.state = 'done'
+            self.write({
+                'state': 'done',
+                'confirmed_price': self._get_cfg_price(),
+            })
         return valid
 
     
@@ -587,3 +734,440 @@ class ProductConfigSessionCustomValue(models.Model):
                 _("Attribute custom type must be 'binary' for saving "
                   "attachments to custom value")
             )
+
+
+class ProductConfigOptionPrice(models.Model):
+    """Materialized prices of the option products attached to the attribute
+    values of a template for a given pricelist. Rows are built on demand by
+    the configured price computation, removed when the prices they derive
+    from change and rebuilt in bulk daily by a cron.
+
+    Prices are stored untaxed, taxes depend on the partner of the reader and
+    are computed when the rows are used. A row without value marks the
+    template as built for the pricelist, company and date so that templates
+    without priced options are not built again on every read"""
+    _name = 'product.config.option.price'
+    _order = 'product_tmpl_id, pricelist_id, value_id'
+
+    product_tmpl_id = fields.Many2one(
+        comodel_name='product.template',
+        string='Product Template',
+        ondelete='cascade',
+        required=True,
+        index=True
+    )
+    pricelist_id = fields.Many2one(
+        comodel_name='product.pricelist',
+        string='Pricelist',
+        ondelete='cascade',
+        required=True,
+        index=True
+    )
+    company_id = fields.Many2one(
+        comodel_name='res.company',
+        string='Company',
+        ondelete='cascade',
+        required=True
+    )
+    date = fields.Date(
+        string='Date',
+        required=True,
+        index=True
+    )
+    value_id = fields.Many2one(
+        comodel_name='product.attribute.value',
+        string='Attribute Value',
+        ondelete='cascade',
+        help='Empty on the row marking the template as built'
+    )
+    product_id = fields.Many2one(
+        comodel_name='product.product',
+        string='Option Product',
+        ondelete='cascade',
+        index=True
+    )
+    price = fields.Float(
+        string='Price',
+        digits='Product Price'
+    )
+    pricelist_item_id = fields.Many2one(
+        comodel_name='product.pricelist.item',
+        string='Pricelist Rule',
+        ondelete='set null',
+        help='Pricelist rule which gave the price of the option'
+    )
+
+    def init(self):
+        # Concurrent builds of the same template insert the same rows,
+        # _build_option_prices() skips the rows already there
+        self.env.cr.execute(
+            'CREATE UNIQUE INDEX IF NOT EXISTS '
+            'product_config_option_price_uniq ON product_config_option_price '
+            '(product_tmpl_id, pricelist_id, company_id, date, '
+            'COALESCE(value_id, 0))'
+        )
+
+    @api.model
+    def _get_option_prices(self, templates, pricelist):
+        """Return the option prices of templates for pricelist, building the
+        rows of the templates not priced yet
+
+        :returns: dictionary {(product_tmpl_id, value_id): row}
+        """
+        rows = self.sudo().search([
+            ('product_tmpl_id', 'in', templates.ids),
+            ('pricelist_id', '=', pricelist.id),
+            ('company_id', '=', self.env.company.id),
+            ('date', '=', fields.Date.context_today(self)),
+        ])
+        built = rows.filtered(lambda row: not row.value_id)
+        missing = templates - built.mapped('product_tmpl_id')
+        if missing:
+            rows |= self._build_option_prices(missing, pricelist)
+        return {
+            (row.product_tmpl_id.id, row.value_id.id): row
+            for row in rows if row.value_id
+        }
+
+    @api.model
+    def _build_option_prices(self, templates, pricelist):
+        """Insert the option price rows of templates for pricelist resolving
+        all the pricelist prices at once. Rows inserted meanwhile by another
+        transaction are left as they are, options missing from the result
+        are priced on the fly by the caller
+
+        :returns: the rows inserted
+        """
+        company_id = self.env.company.id
+        date = fields.Date.context_today(self)
+
+        lines = templates.sudo().mapped('attribute_line_ids')
+        products = lines.mapped('value_ids.product_id')
+        prices = {}
+        if products:
+            # {product_id: (price, pricelist item id)}
+            prices = pricelist._compute_price_rule(list(zip(
+                products, [1.0] * len(products), [False] * len(products))))
+
+        rows = [
+            (template.id, None, None, 0.0, None) for template in templates
+        ]
+        for line in lines:
+            for value in line.value_ids.filtered('product_id'):
+                product = value.product_id
+                price, item_id = prices.get(product.id, (0.0, False))
+                rows.append((line.product_tmpl_id.id, value.id, product.id,
+                             price, item_id or None))
+
+        self.flush()
+        cr = self.env.cr
+        now = fields.Datetime.now()
+        ids = []
+        for batch in tools.split_every(1000, rows):
+            values = [
+                (tmpl_id, pricelist.id, company_id, date, value_id,
+                 product_id, price, item_id, self.env.uid, now,
+                 self.env.uid, now)
+                for tmpl_id, value_id, product_id, price, item_id in batch
+            ]
+            cr.execute(
+                'INSERT INTO product_config_option_price '
+                '(product_tmpl_id, pricelist_id, company_id, date, value_id, '
+                'product_id, price, pricelist_item_id, create_uid, '
+                'create_date, write_uid, write_date) '
+                'VALUES ' + ', '.join(['%s'] * len(values)) + ' '
+                'ON CONFLICT DO NOTHING RETURNING id',
+                values)
+            ids += [row[0] for row in cr.fetchall()]
+        return self.sudo().browse(ids)
+
+    @api.model
+    def _invalidate_option_prices(self, domain):
+        """Remove the rows of the templates and pricelists having rows
+        matching domain, they are built again on the next price computation.
+        Variant prices summing them are removed too"""
+        rows = self.sudo().search(domain)
+        if not rows:
+            return
+        tmpl_ids = rows.mapped('product_tmpl_id').ids
+        pricelist_ids = rows.mapped('pricelist_id').ids
+        self.env['product.config.variant.price']._invalidate_variant_prices([
+            ('product_tmpl_id', 'in', tmpl_ids),
+            ('pricelist_id', 'in', pricelist_ids),
+        ])
+        self.sudo().search([
+            ('product_tmpl_id', 'in', tmpl_ids),
+            ('pricelist_id', 'in', pricelist_ids),
+        ]).unlink()
+
+    @api.model
+    def _cron_rebuild_option_prices(self):
+        """Rebuild the option prices of all configurable templates for all
+        pricelists of every company"""
+        self.env.cr.execute('DELETE FROM product_config_option_price')
+        self.invalidate_cache()
+        templates = self.env['product.template'].search([
+            ('config_ok', '=', True)
+        ])
+        if not templates:
+            return
+        pricelists = self.env['product.pricelist'].search([])
+        for company in self.env['res.company'].search([]):
+            builder = self.with_context(allowed_company_ids=[company.id])
+            for pricelist in pricelists.filtered(
+                    lambda p: not p.company_id or p.company_id == company):
+                builder._build_option_prices(templates, pricelist)
+
+
+class ProductConfigVariantPrice(models.Model):
+    """Configured prices of existing variants per pricelist computed in bulk
+    by reprice() and used by product.product._compute_product_price_extra.
+    Rows are removed along with the option prices they sum up"""
+    _name = 'product.config.variant.price'
+    _order = 'product_id, pricelist_id'
+
+    product_id = fields.Many2one(
+        comodel_name='product.product',
+        string='Product',
+        ondelete='cascade',
+        required=True,
+        index=True
+    )
+    product_tmpl_id = fields.Many2one(
+        comodel_name='product.template',
+        string='Product Template',
+        ondelete='cascade',
+        required=True,
+        index=True
+    )
+    pricelist_id = fields.Many2one(
+        comodel_name='product.pricelist',
+        string='Pricelist',
+        ondelete='cascade',
+        required=True,
+        index=True
+    )
+    company_id = fields.Many2one(
+        comodel_name='res.company',
+        string='Company',
+        ondelete='cascade',
+        required=True
+    )
+    date = fields.Date(
+        string='Date',
+        required=True,
+        index=True
+    )
+    price_subtotal = fields.Float(
+        string='Price Tax Excluded',
+        digits='Product Price'
+    )
+    price_total = fields.Float(
+        string='Price Tax Included',
+        digits='Product Price'
+    )
+    price_extra = fields.Float(
+        string='Price Extra',
+        digits='Product Price'
+    )
+
+    @api.model
+    def _get_variant_prices(self, products, pricelist):
+        """Return the price extras of products for pricelist computed today
+
+        :returns: dictionary {product_id: price_extra}
+        """
+        rows = self.sudo().search([
+            ('product_id', 'in', products.ids),
+            ('pricelist_id', '=', pricelist.id),
+            ('company_id', '=', self.env.company.id),
+            ('date', '=', fields.Date.context_today(self)),
+        ])
+        return {row.product_id.id: row.price_extra for row in rows}
+
+    @api.model
+    def _invalidate_variant_prices(self, domain):
+        self.sudo().search(domain).unlink()
+
+    @api.model
+    def reprice(self, products=None, pricelists=None, batch_size=10000):
+        """Compute and store the configured prices of products for
+        pricelists, by batches of batch_size variants
+
+        :param products: product.product recordset, defaults to all the
+                         configurable variants
+        :param pricelists: product.pricelist recordset, defaults to all the
+                           pricelists
+        :returns: number of variants repriced per pricelist
+        """
+        if products is None:
+            products = self.env['product.product'].search([
+                ('config_ok', '=', True)
+            ])
+        else:
+            products = products.filtered('config_ok')
+        if pricelists is None:
+            pricelists = self.env['product.pricelist'].search([])
+
+        product_obj = self.env['product.product']
+        for pricelist in pricelists:
+            done = 0
+            for batch_ids in tools.split_every(batch_size, products.ids):
+                self._reprice_batch(product_obj.browse(batch_ids), pricelist)
+                done += len(batch_ids)
+                _logger.info(
+                    "Repriced %s/%s configured variants for pricelist %s",
+                    done, len(products), pricelist.display_name)
+        return len(products)
+
+    @api.model
+    def _reprice_batch(self, products, pricelist):
+        """Compute the configured prices of products as the product of the
+        variant x option incidence matrix with the option price vectors of
+        the option price table, then store them with batched queries"""
+        if not products:
+            return
+        cr = self.env.cr
+        company_id = self.env.company.id
+        date = fields.Date.context_today(self)
+
+        field = products._fields['attribute_value_ids']
+        cr.execute(
+            'SELECT "{col1}", "{col2}" FROM "{rel}" WHERE "{col1}" IN %s'
+            .format(col1=field.column1, col2=field.column2,
+                    rel=field.relation),
+            [tuple(products.ids)])
+        incidence = cr.fetchall()
+        cr.execute(
+            'SELECT id, product_tmpl_id FROM product_product WHERE id IN %s',
+            [tuple(products.ids)])
+        tmpl_map = dict(cr.fetchall())
+
+        templates = self.env['product.template'].browse(
+            set(tmpl_map.values()))
+        option_table = self.env[
+            'product.config.option.price']._get_option_prices(
+                templates, pricelist)
+
+        # Option price vectors, taxes of the untaxed rows are computed once
+        # per column and rows of options without price sum up to 0
+        columns = {}
+        components = []
+        for key, row in option_table.items():
+            columns[key] = len(components)
+            components.append((
+                row.product_id.taxes_id.sudo(), row.price,
+                row.product_tmpl_id
+            ))
+        tmpl_obj = self.env['product.template']
+        tax_results = tmpl_obj._compute_components_taxes(
+            components, pricelist.currency_id)
+        totals = [
+            tax_res['total_included'] if price else 0.0
+            for (taxes, price, template), tax_res
+            in zip(components, tax_results)
+        ]
+        subtotals = [
+            tax_res['total_excluded'] if price else 0.0
+            for (taxes, price, template), tax_res
+            in zip(components, tax_results)
+        ]
+
+        # Values outside of the template lines are only priced by
+        # get_cfg_price_batch(), variants using them are priced through it
+        positions = {product_id: i for i, product_id in enumerate(
+            products.ids)}
+        row_idx = []
+        col_idx = []
+        outside = []
+        for product_id, value_id in incidence:
+            col = columns.get((tmpl_map[product_id], value_id))
+            if col is None:
+                outside.append((product_id, value_id))
+                continue
+            row_idx.append(positions[product_id])
+            col_idx.append(col)
+        outside_values = self.env['product.attribute.value'].sudo().browse(
+            set(value_id for product_id, value_id in outside))
+        priced_value_ids = set(outside_values.filtered('product_id').ids)
+        fallback_ids = set(
+            product_id for product_id, value_id in outside
+            if value_id in priced_value_ids
+        )
+
+        nr_products = len(products)
+        option_totals = incidence_dot(row_idx, col_idx, totals, nr_products)
+        option_subtotals = incidence_dot(
+            row_idx, col_idx, subtotals, nr_products)
+
+        # Base prices of the templates, taxes computed once per distinct
+        # (taxes, price, template)
+        base_prices = pricelist.get_products_price(
+            templates, [1.0] * len(templates), [False] * len(templates))
+        templates = templates.sudo()
+        tax_results = tmpl_obj._compute_components_taxes([
+            (template.taxes_id, base_prices.get(template.id, 0.0), template)
+            for template in templates
+        ], pricelist.currency_id)
+        base = {
+            template.id: (
+                tax_res['total_included'],
+                tax_res['total_excluded'],
+                template.list_price,
+            )
+            for template, tax_res in zip(templates, tax_results)
+        }
+
+        rows = []
+        for i, product_id in enumerate(products.ids):
+            if product_id in fallback_ids:
+                continue
+            tmpl_id = tmpl_map[product_id]
+            total, subtotal, list_price = base[tmpl_id]
+            total += option_totals[i]
+            subtotal += option_subtotals[i]
+            rows.append((product_id, tmpl_id, total, subtotal,
+                         subtotal - list_price))
+
+        if fallback_ids:
+            fallback = products.browse(fallback_ids)
+            configurations = [
+                (product.product_tmpl_id, product.attribute_value_ids.ids, {})
+                for product in fallback
+            ]
+            fallback_prices = self.env[
+                'product.template']._compute_cfg_price_batch(
+                    configurations, pricelist)
+            for product, prices in zip(fallback, fallback_prices):
+                subtotal = prices['total'] - prices['taxes']
+                rows.append((
+                    product.id, product.product_tmpl_id.id, prices['total'],
+                    subtotal, subtotal - product.product_tmpl_id.list_price
+                ))
+
+        cr.execute(
+            'DELETE FROM product_config_variant_price '
+            'WHERE product_id IN %s AND pricelist_id = %s '
+            'AND company_id = %s',
+            [tuple(products.ids), pricelist.id, company_id])
+        now = fields.Datetime.now()
+        for batch in tools.split_every(1000, rows):
+            values = [
+                (product_id, tmpl_id, pricelist.id, company_id, date,
+                 total, subtotal, extra, self.env.uid, now, self.env.uid,
+                 now)
+                for product_id, tmpl_id, total, subtotal, extra in batch
+            ]
+            cr.execute(
+                'INSERT INTO product_config_variant_price '
+                '(product_id, product_tmpl_id, pricelist_id, company_id, '
+                'date, price_total, price_subtotal, price_extra, '
+                'create_uid, create_date, write_uid, write_date) '
+                'VALUES ' + ', '.join(['%s'] * len(values)),
+                values)
+        self.invalidate_cache()
+
+    @api.model
+    def _cron_reprice_variants(self):
+        """Reprice all configurable variants for all pricelists"""
+        self.reprice()
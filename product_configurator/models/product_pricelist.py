@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, api
+
+
+class ProductPricelist(models.Model):
+    _inherit = ['product.pricelist', 'product.config.price.cache.mixin']
+    _name = 'product.pricelist'
+
+    def _get_dependent_pricelists(self):
+        """Return the pricelists along with all the pricelists based on
+        them, directly or not"""
+        pricelists = todo = self
+        item_obj = self.env['product.pricelist.item'].sudo()
+        while todo:
+            todo = item_obj.search([
+                ('base', '=', 'pricelist'),
+                ('base_pricelist_id', 'in', todo.ids),
+            ]).mapped('pricelist_id') - pricelists
+            pricelists |= todo
+        return pricelists
+
+    def _invalidate_option_prices(self):
+        pricelist_ids = self._get_dependent_pricelists().ids
+        self.env['product.config.option.price']._invalidate_option_prices([
+            ('pricelist_id', 'in', pricelist_ids)
+        ])
+        self.env['product.config.variant.price']._invalidate_variant_prices([
+            ('pricelist_id', 'in', pricelist_ids)
+        ])
+
+    def write(self, vals):
+        res = super(ProductPricelist, self).write(vals)
+        self._invalidate_option_prices()
+        return res
+
+
+class ProductPricelistItem(models.Model):
+    _inherit = ['product.pricelist.item', 'product.config.price.cache.mixin']
+    _name = 'product.pricelist.item'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        items = super(ProductPricelistItem, self).create(vals_list)
+        items.mapped('pricelist_id')._invalidate_option_prices()
+        return items
+
+    def write(self, vals):
+        pricelists = self.mapped('pricelist_id')
+        res = super(ProductPricelistItem, self).write(vals)
+        (pricelists | self.mapped('pricelist_id'))._invalidate_option_prices()
+        return res
+
+    def unlink(self):
+        self.mapped('pricelist_id')._invalidate_option_prices()
+        return super(ProductPricelistItem, self).unlink()
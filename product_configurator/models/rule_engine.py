@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+"""ORM free representation of the configuration rules of a product.template
+
+The product.config.line / product.config.domain graph of a template is
+compiled once into plain Python structures holding only database ids so
+it can be kept in the registry cache and evaluated without touching the
+ORM.
+
+Configurations are represented as ConfigBitset objects: every attribute
+value known to the template gets a dense bit position so a selection is a
+single Python int and checking a domain line is a single AND.
+"""
+
+OR = '|'
+
+
+def bit_count(bits):
+    """Return the number of bits set in bits"""
+    return bin(bits).count('1')
+
+
+class ValueIndex(object):
+    """Dense bit positions of the attribute values of a template
+
+    :param value_ids: iterable of attribute value ids, the position of a
+                      value in the iterable is its bit position
+    """
+
+    __slots__ = ('value_ids', 'positions')
+
+    def __init__(self, value_ids):
+        self.value_ids = tuple(value_ids)
+        self.positions = {
+            value_id: pos for pos, value_id in enumerate(self.value_ids)
+        }
+
+    def mask(self, value_ids):
+        """Return the bitmask of value_ids, unknown ids are ignored"""
+        positions = self.positions
+        bits = 0
+        for value_id in value_ids:
+            pos = positions.get(value_id)
+            if pos is not None:
+                bits |= 1 << pos
+        return bits
+
+    def ids(self, bits):
+        """Return the list of value ids set in bits"""
+        value_ids = self.value_ids
+        res = []
+        while bits:
+            low = bits & -bits
+            res.append(value_ids[low.bit_length() - 1])
+            bits ^= low
+        return res
+
+    def bitset(self, value_ids):
+        """Return a ConfigBitset holding value_ids"""
+        return ConfigBitset(self, self.mask(value_ids))
+
+    def extend(self, value_ids):
+        """Return an index holding value_ids as well, self when it already
+        holds them. Values of self keep their position so bits built on self
+        mean the same on the extended index"""
+        positions = self.positions
+        missing = sorted(set(
+            value_id for value_id in value_ids if value_id not in positions
+        ))
+        if not missing:
+            return self
+        return ValueIndex(self.value_ids + tuple(missing))
+
+
+class ConfigBitset(object):
+    """Immutable set of attribute values of a template stored as an int
+
+    Iterating a bitset yields value ids so it can be passed where a list
+    of value ids is expected.
+    """
+
+    __slots__ = ('index', 'bits')
+
+    def __init__(self, index, bits=0):
+        self.index = index
+        self.bits = bits
+
+    def ids(self):
+        return self.index.ids(self.bits)
+
+    def _check_index(self, other):
+        if self.index is not other.index:
+            raise ValueError(
+                'Cannot combine bitsets built on different value indexes')
+
+    def __iter__(self):
+        return iter(self.ids())
+
+    def __len__(self):
+        return bit_count(self.bits)
+
+    def __bool__(self):
+        return bool(self.bits)
+
+    __nonzero__ = __bool__
+
+    def __contains__(self, value_id):
+        pos = self.index.positions.get(value_id)
+        return pos is not None and bool(self.bits >> pos & 1)
+
+    def __and__(self, other):
+        self._check_index(other)
+        return ConfigBitset(self.index, self.bits & other.bits)
+
+    def __or__(self, other):
+        self._check_index(other)
+        return ConfigBitset(self.index, self.bits | other.bits)
+
+    def __sub__(self, other):
+        self._check_index(other)
+        return ConfigBitset(self.index, self.bits & ~other.bits)
+
+    def __eq__(self, other):
+        return isinstance(other, ConfigBitset) and \
+            self.index is other.index and self.bits == other.bits
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.bits)
+
+    def __repr__(self):
+        return 'ConfigBitset(%s)' % self.ids()
+
+
+def compile_domain(domain, index=None):
+    """Compile a domain as returned by product.config.domain.compute_domain()
+    into a program ready to be evaluated.
+
+    The program holds the tokens of the domain in reversed order (polish
+    notation is evaluated right to left) with every leaf turned into a
+    (condition == 'in', values) pair. Values are a bitmask when index is
+    given and a frozenset of ids otherwise.
+
+    :param domain: list of '|' operators and (attr_id, condition, value_ids)
+    :param index: optional ValueIndex used to compile leaves to bitmasks
+    :returns: tuple of compiled tokens
+    """
+    program = []
+    for token in reversed(domain):
+        if isinstance(token, tuple):
+            if index is not None:
+                values = index.mask(token[2])
+            else:
+                values = frozenset(token[2])
+            program.append((token[1] == 'in', values))
+        else:
+            program.append(OR)
+    return tuple(program)
+
+
+def eval_program(program, selection):
+    """Evaluate a compiled domain against the selected values
+
+    :param program: tuple of tokens as returned by compile_domain()
+    :param selection: bits of the selection for programs compiled with an
+                      index, set of selected value ids otherwise
+    :returns: boolean result of the domain
+    """
+    stack = []
+    for token in program:
+        if token == OR:
+            # compute_domain() only inserts 'or' operators with 2 operands
+            operand1 = stack.pop()
+            operand2 = stack.pop()
+            stack.append(operand1 or operand2)
+        else:
+            contains, values = token
+            stack.append(contains == bool(values & selection))
+    # 'and' operator is implied for remaining stack elements
+    return all(stack)
+
+
+class ConfigRules(object):
+    """Compiled configuration rules of a single product.template
+
+    Domain evaluations are memoized on the (domain id, projection of the
+    selection on the values tested by the domain) pair so values gated by
+    the same rule cost a single evaluation and a result survives changes
+    to unrelated attributes. Since the rules are immutable the memo lives
+    as long as the compiled rules themselves.
+
+    :param index: ValueIndex of the values known to the template
+    :param domains: dict {domain_id: program compiled with index}
+    :param value_domains: dict {value_id: tuple of domain_ids}, the
+                          domains of every config line restricting value_id
+    :param line_values: dict {attribute_line_id: tuple of value_ids}
+    :param line_attributes: dict {attribute_line_id: attribute_id}
+    :param attribute_values: dict {attribute_id: frozenset of value_ids}
+                             of the values set on the attribute lines
+    :param dependents: dict {attribute_id: frozenset of attribute_line_ids}
+                       whose availability or defaults test the attribute
+    :param memo_size: maximum number of memoized domain evaluations
+    """
+
+    __slots__ = (
+        'index', 'domains', 'value_domains', 'line_values', 'restricted',
+        'line_attributes', 'attribute_values', 'dependents',
+        'supports', 'memo', 'memo_size', 'hits', 'misses',
+    )
+
+    def __init__(self, index, domains, value_domains, line_values=None,
+                 line_attributes=None, attribute_values=None,
+                 dependents=None, memo_size=4096):
+        self.index = index
+        self.domains = domains
+        self.value_domains = value_domains
+        self.line_values = line_values or {}
+        self.line_attributes = line_attributes or {}
+        self.attribute_values = attribute_values or {}
+        self.dependents = dependents or {}
+        # Values without config lines are always available
+        self.restricted = index.mask(value_domains)
+        # Bits of the values each domain actually tests
+        self.supports = {
+            domain_id: self._get_support(program)
+            for domain_id, program in domains.items()
+        }
+        self.memo = {}
+        self.memo_size = memo_size
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _get_support(program):
+        support = 0
+        for token in program:
+            if token != OR:
+                support |= token[1]
+        return support
+
+    def eval_domain(self, domain_id, selection):
+        """Evaluate the compiled domain domain_id against selection bits"""
+        program = self.domains.get(domain_id)
+        if not program:
+            return True
+        key = (domain_id, selection & self.supports[domain_id])
+        res = self.memo.get(key)
+        if res is not None:
+            self.hits += 1
+            return res
+        self.misses += 1
+        res = eval_program(program, key[1])
+        if len(self.memo) >= self.memo_size:
+            self.memo.clear()
+        self.memo[key] = res
+        return res
+
+    def stats(self):
+        """Return the counters of the domain evaluation memo"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.memo),
+        }
+
+    def is_available(self, value_id, selection):
+        """Check if value_id passes all the restrictions set on it"""
+        for domain_id in self.value_domains.get(value_id, ()):
+            if not self.eval_domain(domain_id, selection):
+                return False
+        return True
+
+    def values_available(self, value_ids, selection):
+        """Return the ids of value_ids available given selection bits,
+        keeping the order of value_ids"""
+        return [
+            value_id for value_id in value_ids
+            if self.is_available(value_id, selection)
+        ]
+
+    def values_available_bulk(self, selection, line_ids=None):
+        """Return the available values of every attribute line given
+        selection bits
+
+        :param line_ids: optional iterable of attribute line ids to restrict
+                         the evaluation to
+        :returns: dict {attribute_line_id: list of available value ids}
+        """
+        if line_ids is not None:
+            line_ids = set(line_ids)
+        return {
+            line_id: self.values_available(value_ids, selection)
+            for line_id, value_ids in self.line_values.items()
+            if line_ids is None or line_id in line_ids
+        }
+
+    def get_dependent_lines(self, attr_ids):
+        """Return the ids of the attribute lines to re-evaluate when the
+        values of attr_ids change"""
+        line_ids = set()
+        for attr_id in attr_ids:
+            line_ids |= self.dependents.get(attr_id, frozenset())
+        return line_ids
+
+    def available_bits(self, candidates, selection):
+        """Return the bits of candidates available given selection bits,
+        bits of values outside the index are not restricted and kept"""
+        restricted = candidates & self.restricted
+        available = candidates ^ restricted
+        value_ids = self.index.value_ids
+        while restricted:
+            low = restricted & -restricted
+            restricted ^= low
+            if self.is_available(value_ids[low.bit_length() - 1], selection):
+                available |= low
+        return available
@@ -2,3 +2,5 @@
 
 from . import test_create
 from . import test_configuration_rules
+from . import test_benchmark
+from . import test_pricing
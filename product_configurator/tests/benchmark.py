@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""Helpers of the configurator benchmarks
+
+Benchmarks are regular test cases tagged 'benchmark' and excluded from the
+standard test run, launch them with --test-tags benchmark. The scale of the
+generated template can be set through the PRODUCT_CONFIGURATOR_BENCHMARK_SCALE
+environment variable holding a JSON dictionary overriding DEFAULT_SCALE.
+
+Every measure is logged and, when PRODUCT_CONFIGURATOR_BENCHMARK_OUTPUT is
+set, appended to that file as a JSON line so results of two revisions can be
+compared.
+"""
+
+import json
+import logging
+import os
+import time
+
+from odoo.tests.common import TransactionCase
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_SCALE = {
+    'attributes': 10,
+    'values': 6,
+    'config_lines': 10,
+    'domain_depth': 2,
+    'implied_chain': 2,
+    'steps': 2,
+    'defaults': 2,
+    'images': 2,
+    'repeat': 5,
+}
+
+# 1x1 transparent png
+IMAGE = (
+    b'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChw'
+    b'GA60e6kgAAAABJRU5ErkJggg=='
+)
+
+
+def get_benchmark_scale():
+    """Return the scale of the benchmarks, DEFAULT_SCALE updated with the
+    values of the PRODUCT_CONFIGURATOR_BENCHMARK_SCALE environment variable"""
+    scale = dict(DEFAULT_SCALE)
+    scale.update(json.loads(
+        os.environ.get('PRODUCT_CONFIGURATOR_BENCHMARK_SCALE') or '{}'))
+    return scale
+
+
+def create_benchmark_template(env, scale):
+    """Create a configurable template with synthetic rules
+
+    Attribute n is restricted by config lines whose domains test the
+    attributes preceding it so the first value of every attribute always
+    makes up a valid configuration.
+
+    :param scale: dictionary of sizes as in DEFAULT_SCALE
+    :returns: product.template record
+    """
+    nr_attrs = max(scale['attributes'], 2)
+    nr_values = max(scale['values'], 2)
+
+    attributes = env['product.attribute']
+    for i in range(nr_attrs):
+        attributes |= attributes.create({
+            'name': 'Benchmark %s' % i,
+            'value_ids': [
+                (0, 0, {'name': 'Benchmark %s-%s' % (i, j)})
+                for j in range(nr_values)
+            ],
+        })
+
+    template = env['product.template'].create({
+        'name': 'Benchmark Configuration',
+        'config_ok': True,
+        'type': 'product',
+        'attribute_line_ids': [
+            (0, 0, {
+                'attribute_id': attribute.id,
+                'value_ids': [(6, 0, attribute.value_ids.ids)],
+                'required': True,
+            })
+            for attribute in attributes
+        ],
+    })
+    attr_lines = template.attribute_line_ids.sorted(
+        lambda l: attributes.ids.index(l.attribute_id.id))
+
+    domain_obj = env['product.config.domain']
+
+    # Chain of implied domains, always true
+    implied = domain_obj
+    for i in range(scale['implied_chain']):
+        implied = domain_obj.create({
+            'name': 'Benchmark implied %s' % i,
+            'domain_line_ids': [(0, 0, {
+                'attribute_id': attributes[0].id,
+                'condition': 'in',
+                'value_ids': [(6, 0, attributes[0].value_ids.ids)],
+                'operator': 'and',
+            })],
+            'implied_ids': [(6, 0, implied.ids)],
+        })
+
+    for i in range(scale['config_lines']):
+        pos = i % (nr_attrs - 1) + 1
+        attr_line = attr_lines[pos]
+        domain_lines = []
+        for depth in range(min(scale['domain_depth'], pos) or 1):
+            attribute = attributes[(pos - depth - 1) % pos]
+            domain_lines.append((0, 0, {
+                'attribute_id': attribute.id,
+                'condition': 'in',
+                'value_ids': [(6, 0, attribute.value_ids[:-1].ids)],
+                'operator': 'and' if depth % 2 else 'or',
+                'sequence': depth,
+            }))
+        domain = domain_obj.create({
+            'name': 'Benchmark domain %s' % i,
+            'domain_line_ids': domain_lines,
+            'implied_ids': [(6, 0, implied.ids)],
+        })
+        env['product.config.line'].create({
+            'product_tmpl_id': template.id,
+            'attribute_line_id': attr_line.id,
+            'value_ids': [
+                (6, 0, attr_line.value_ids[:(nr_values + 1) // 2].ids)],
+            'domain_id': domain.id,
+        })
+
+    for i in range(scale['defaults']):
+        attr_line = attr_lines[i % nr_attrs]
+        env['product.config.default'].create({
+            'product_tmpl_id': template.id,
+            'value_ids': [(6, 0, attr_line.value_ids[:1].ids)],
+        })
+
+    nr_steps = min(scale['steps'], nr_attrs)
+    for i in range(nr_steps):
+        step = env['product.config.step'].create({
+            'name': 'Benchmark step %s' % i,
+        })
+        env['product.config.step.line'].create({
+            'product_tmpl_id': template.id,
+            'config_step_id': step.id,
+            'attribute_line_ids': [(6, 0, attr_lines[i::nr_steps].ids)],
+            'sequence': i,
+        })
+
+    for i in range(scale['images']):
+        env['product.config.image'].create({
+            'name': 'Benchmark image %s' % i,
+            'product_tmpl_id': template.id,
+            'image': IMAGE,
+            'value_ids': [(6, 0, [
+                attr_lines[j % nr_attrs].value_ids[0].id
+                for j in range(i + 1)
+            ])],
+        })
+    return template
+
+
+class BenchmarkCase(TransactionCase):
+    """Base class of the benchmarks, creates a synthetic template and
+    provides measure() to time a callable"""
+
+    @classmethod
+    def setUpClass(cls):
+        super(BenchmarkCase, cls).setUpClass()
+        cls.scale = get_benchmark_scale()
+        cls.results = []
+
+    @classmethod
+    def tearDownClass(cls):
+        output = os.environ.get('PRODUCT_CONFIGURATOR_BENCHMARK_OUTPUT')
+        if output and cls.results:
+            with open(output, 'a') as f:
+                for res in cls.results:
+                    f.write(json.dumps(res, sort_keys=True) + '\n')
+        super(BenchmarkCase, cls).tearDownClass()
+
+    def setUp(self):
+        super(BenchmarkCase, self).setUp()
+        self.cfg_tmpl = create_benchmark_template(self.env, self.scale)
+        self.value_ids = [
+            line.value_ids[0].id for line in self.cfg_tmpl.attribute_line_ids
+        ]
+
+    def measure(self, name, func, repeat=None):
+        """Call func repeat times and record the timings and the number of
+        queries, the first call is reported separately as the cold run
+
+        :returns: the result of the last call of func
+        """
+        if repeat is None:
+            repeat = self.scale['repeat']
+        cr = self.env.cr
+        timings = []
+        queries = []
+        res = None
+        for i in range(max(repeat, 1)):
+            count = cr.sql_log_count
+            start = time.time()
+            res = func()
+            timings.append(time.time() - start)
+            queries.append(cr.sql_log_count - count)
+        warm = timings[1:] or timings
+        result = {
+            'benchmark': '%s.%s' % (self.__class__.__name__, name),
+            'scale': self.scale,
+            'repeat': len(timings),
+            'cold': timings[0],
+            'min': min(warm),
+            'mean': sum(warm) / len(warm),
+            'queries_cold': queries[0],
+            'queries': queries[-1],
+        }
+        self.results.append(result)
+        _logger.info('benchmark %s', json.dumps(result, sort_keys=True))
+        return res
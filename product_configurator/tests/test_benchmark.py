@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tests import tagged
+
+from .benchmark import BenchmarkCase
+
+
+@tagged('-standard', 'benchmark')
+class ConfigurationBenchmark(BenchmarkCase):
+
+    def test_values_available(self):
+        attr_val_ids = self.cfg_tmpl.attribute_line_ids.mapped(
+            'value_ids').ids
+        self.measure(
+            'values_available',
+            lambda: self.cfg_tmpl.values_available(
+                attr_val_ids, self.value_ids))
+
+    def test_validate_configuration(self):
+        res = self.measure(
+            'validate_configuration',
+            lambda: self.cfg_tmpl.validate_configuration(self.value_ids))
+        self.assertTrue(res, "Benchmark configuration is not valid")
+
+    def test_find_default_value(self):
+        line = self.cfg_tmpl.attribute_line_ids[-1]
+        self.measure(
+            'find_default_value',
+            lambda: self.cfg_tmpl.find_default_value(
+                line.value_ids.ids, self.value_ids[:-1]))
+
+    def test_get_open_step_lines(self):
+        self.measure(
+            'get_open_step_lines',
+            lambda: self.cfg_tmpl.get_open_step_lines(self.value_ids))
+
+    def test_get_cfg_price(self):
+        self.measure(
+            'get_cfg_price',
+            lambda: self.cfg_tmpl.get_cfg_price(self.value_ids))
+
+    def test_search_variant(self):
+        self.cfg_tmpl.create_get_variant(self.value_ids)
+        self.measure(
+            'search_variant',
+            lambda: self.cfg_tmpl.search_variant(self.value_ids))
+
+    def test_create_get_variant(self):
+        variant = self.measure(
+            'create_get_variant',
+            lambda: self.cfg_tmpl.create_get_variant(self.value_ids))
+        self.assertEqual(
+            set(variant.attribute_value_ids.ids), set(self.value_ids))
@@ -141,3 +141,191 @@ class ConfigurationRules(TransactionCase):
         )
 
     # Test configuration with disallowed custom type value
+
+    def test_compiled_rules(self):
+        """Compiled rules give the same availability as evaluating the
+        domains of the configuration lines directly"""
+        confs = [
+            ['gasoline'],
+            ['diesel', '220d'],
+            ['gasoline', '218i', 'model_luxury_line'],
+        ]
+        attr_vals = self.cfg_tmpl.attribute_line_ids.mapped('value_ids')
+        for conf in confs:
+            attr_val_ids = self.get_attr_val_ids(conf)
+            expected = []
+            for attr_val in attr_vals:
+                config_lines = self.cfg_tmpl.config_line_ids.filtered(
+                    lambda l: attr_val in l.value_ids)
+                domains = config_lines.mapped('domain_id').compute_domain()
+                if self.cfg_tmpl.validate_domains_against_sels(
+                        domains, attr_val_ids):
+                    expected.append(attr_val.id)
+            self.assertEqual(
+                self.cfg_tmpl.values_available(attr_vals.ids, attr_val_ids),
+                expected,
+                "Compiled rules do not match configuration line domains"
+            )
+
+    def test_values_available_bulk(self):
+        """Availability of all the attribute lines at once matches the
+        availability of every line on its own"""
+        confs = [
+            [],
+            ['gasoline'],
+            ['diesel', '220d'],
+            ['gasoline', '218i', 'model_luxury_line'],
+        ]
+        attr_lines = self.cfg_tmpl.attribute_line_ids
+        for conf in confs:
+            attr_val_ids = self.get_attr_val_ids(conf)
+            avail_val_ids = self.cfg_tmpl.values_available_bulk(attr_val_ids)
+            self.assertEqual(set(avail_val_ids), set(attr_lines.ids))
+            for line in attr_lines:
+                self.assertEqual(
+                    avail_val_ids[line.id],
+                    self.cfg_tmpl.values_available(
+                        line.value_ids.ids, attr_val_ids),
+                    "Bulk availability differs for %s" % line.display_name
+                )
+
+        model_line = self.env.ref(
+            'product_configurator.product_attribute_line_2_series_model_line')
+        self.assertEqual(
+            list(self.cfg_tmpl.values_available_bulk(
+                self.get_attr_val_ids(['gasoline']), [model_line.id])),
+            [model_line.id]
+        )
+
+    def test_compiled_rules_invalidation(self):
+        """Compiled rules are refreshed when configuration lines change"""
+        conf = ['diesel']
+        attr_val_ids = self.get_attr_val_ids(conf)
+        gasoline_engines = self.env.ref(
+            'product_configurator.product_config_line_gasoline_engines'
+        )
+        engine_ids = gasoline_engines.value_ids.ids
+        self.assertFalse(
+            self.cfg_tmpl.values_available(engine_ids, attr_val_ids),
+            "Gasoline engines available for diesel configuration"
+        )
+        gasoline_engines.unlink()
+        self.assertEqual(
+            self.cfg_tmpl.values_available(engine_ids, attr_val_ids),
+            engine_ids,
+            "Compiled rules were not refreshed after removing a config line"
+        )
+
+    def test_bitset_configuration(self):
+        """Bitset configurations give the same results as lists"""
+        conf = [
+            'gasoline', '228i', 'model_luxury_line', 'silver', 'rims_384',
+            'tapistry_black', 'steptronic', 'smoker_package', 'tow_hook'
+        ]
+        attr_val_ids = self.get_attr_val_ids(conf)
+        attr_vals = self.cfg_tmpl.attribute_line_ids.mapped('value_ids')
+
+        selection = self.cfg_tmpl._get_config_bitset(attr_val_ids)
+        candidates = self.cfg_tmpl._get_config_bitset(attr_vals.ids)
+        self.assertEqual(set(selection), set(attr_val_ids))
+
+        avail = self.cfg_tmpl.values_available(candidates, selection)
+        self.assertEqual(
+            set(avail),
+            set(self.cfg_tmpl.values_available(attr_vals.ids, attr_val_ids)),
+            "Bitset availability differs from list availability"
+        )
+        self.assertTrue(
+            self.cfg_tmpl.validate_configuration(selection),
+            "Valid bitset configuration failed validation"
+        )
+
+    def test_memoized_domains(self):
+        """Domains shared by several values are evaluated once per
+        relevant selection"""
+        gasoline_engines = self.env.ref(
+            'product_configurator.product_config_line_gasoline_engines'
+        )
+        engine_ids = gasoline_engines.value_ids.ids
+        self.cfg_tmpl.values_available(
+            engine_ids, self.get_attr_val_ids(['gasoline']))
+        stats = self.cfg_tmpl.get_config_rules_stats()
+
+        # Selecting an unrelated value does not change the fuel projection
+        self.cfg_tmpl.values_available(
+            engine_ids, self.get_attr_val_ids(['gasoline', 'silver']))
+        new_stats = self.cfg_tmpl.get_config_rules_stats()
+        self.assertEqual(new_stats['misses'], stats['misses'])
+        self.assertEqual(
+            new_stats['hits'] - stats['hits'], len(engine_ids),
+            "Shared domain was evaluated more than once"
+        )
+
+    def test_trans_implied_cycle(self):
+        """Transitive closure of implied domains is maintained and does not
+        recurse endlessly on cycles"""
+        domain_obj = self.env['product.config.domain']
+        gasoline = self.env.ref(
+            'product_configurator.product_config_domain_gasoline')
+        domain_a = domain_obj.create({'name': 'A'})
+        domain_b = domain_obj.create({
+            'name': 'B',
+            'implied_ids': [(6, 0, [domain_a.id])]
+        })
+        domain_a.write({'implied_ids': [(6, 0, [domain_b.id, gasoline.id])]})
+
+        self.assertEqual(domain_a.trans_implied_ids,
+                         domain_a | domain_b | gasoline)
+        self.assertEqual(domain_b.trans_implied_ids,
+                         domain_a | domain_b | gasoline)
+        self.assertEqual(domain_b.compute_domain(), gasoline.compute_domain())
+
+    def test_bitset_unknown_values(self):
+        """Values unknown to the compiled rules are available in bitsets as
+        they are in lists"""
+        attribute = self.env['product.attribute'].create({'name': 'Other'})
+        other_value = self.env['product.attribute.value'].create({
+            'name': 'Other value',
+            'attribute_id': attribute.id,
+        })
+        gasoline_engines = self.env.ref(
+            'product_configurator.product_config_line_gasoline_engines'
+        )
+        candidate_ids = gasoline_engines.value_ids.ids + [other_value.id]
+        for conf in [['gasoline'], ['diesel']]:
+            attr_val_ids = self.get_attr_val_ids(conf)
+            candidates = self.cfg_tmpl._get_config_bitset(candidate_ids)
+            avail = self.cfg_tmpl.values_available(candidates, attr_val_ids)
+            self.assertIn(other_value.id, avail)
+            self.assertEqual(
+                set(avail),
+                set(self.cfg_tmpl.values_available(
+                    candidate_ids, attr_val_ids)),
+                "Bitset availability differs from list availability"
+            )
+        self.assertTrue(self.cfg_tmpl.validate_configuration(
+            self.get_attr_val_ids(['gasoline']) + [other_value.id],
+            final=False))
+
+    def test_configurator_metadata(self):
+        """The metadata snapshot of a template is reused until its attribute
+        lines change"""
+        tmpl_obj = self.env['product.template']
+        metadata = tmpl_obj._get_configurator_metadata(self.cfg_tmpl.id)
+        self.assertIs(
+            tmpl_obj._get_configurator_metadata(self.cfg_tmpl.id), metadata)
+        self.assertEqual(
+            [line.id for line in metadata.attribute_lines],
+            self.cfg_tmpl.attribute_line_ids.sorted().ids
+        )
+
+        attr_line = self.cfg_tmpl.attribute_line_ids.filtered(
+            lambda l: not l.required)[:1]
+        self.assertTrue(attr_line)
+        attr_line.required = True
+        new_metadata = tmpl_obj._get_configurator_metadata(self.cfg_tmpl.id)
+        self.assertIsNot(new_metadata, metadata)
+        line_metadata = next(
+            line for line in new_metadata.attribute_lines
+            if line.id == attr_line.id)
+        self.assertTrue(line_metadata.required)
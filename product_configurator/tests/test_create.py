@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+from odoo.exceptions import ValidationError
 from odoo.tests.common import TransactionCase
 
 
@@ -33,3 +34,182 @@ class ConfigurationCreate(TransactionCase):
 
         self.assertEqual(test_template.product_variant_count, 0,
                          "Create should not have any variants")
+
+    def test_search_variant(self):
+        """Test variants are found by configuration fingerprint regardless
+        of the order of the values and duplicates are refused"""
+        cfg_tmpl = self.env.ref('product_configurator.bmw_2_series')
+        attr_val_prefix = 'product_configurator.product_attribute_value_%s'
+        value_ids = [
+            self.env.ref(attr_val_prefix % ext_id).id for ext_id in [
+                'gasoline', '228i', 'model_luxury_line', 'silver',
+                'rims_384', 'tapistry_black', 'steptronic', 'smoker_package',
+                'tow_hook'
+            ]
+        ]
+        variant = cfg_tmpl.create_get_variant(value_ids)
+        self.assertTrue(variant.config_fingerprint)
+        self.assertEqual(
+            cfg_tmpl.search_variant(list(reversed(value_ids))), variant)
+        self.assertFalse(cfg_tmpl.search_variant(value_ids[:-1]))
+        self.assertEqual(cfg_tmpl.create_get_variant(value_ids), variant)
+
+        with self.assertRaises(ValidationError):
+            self.env['product.product'].create(
+                cfg_tmpl.get_variant_vals(value_ids))
+
+    def test_create_get_variants(self):
+        """Test bulk variant creation reuses existing variants and creates
+        identical configurations once"""
+        cfg_tmpl = self.env.ref('product_configurator.bmw_2_series')
+        attr_val_prefix = 'product_configurator.product_attribute_value_%s'
+        value_ids = [
+            [self.env.ref(attr_val_prefix % ext_id).id for ext_id in conf]
+            for conf in [
+                ['gasoline', '228i', 'model_luxury_line', 'silver',
+                 'rims_384', 'tapistry_black', 'steptronic'],
+                ['gasoline', '218i', 'model_luxury_line', 'silver',
+                 'rims_384', 'tapistry_black', 'steptronic'],
+                ['diesel', '220d', 'model_sport_line', 'silver',
+                 'rims_384', 'tapistry_black', 'steptronic'],
+            ]
+        ]
+        existing = cfg_tmpl.create_get_variant(value_ids[0])
+        configurations = [
+            (value_ids[0], None),
+            (value_ids[1], {}),
+            (value_ids[2], None),
+            (list(reversed(value_ids[1])), None),
+        ]
+        variants = cfg_tmpl.create_get_variants(configurations)
+        self.assertEqual(len(variants), len(configurations))
+        self.assertEqual(variants[0], existing)
+        self.assertEqual(variants[1], variants[3])
+        self.assertEqual(len(set(variants)), 3)
+        for (conf_value_ids, custom_values), variant in zip(
+                configurations, variants):
+            self.assertEqual(cfg_tmpl.search_variant(conf_value_ids), variant)
+
+        with self.assertRaises(ValidationError):
+            cfg_tmpl.create_get_variants([(value_ids[0][:2], None)])
+
+    def test_duplicate_check_bulk(self):
+        """Test duplicates are detected on bulk writes among the records
+        written and against existing variants"""
+        cfg_tmpl = self.env.ref('product_configurator.bmw_2_series')
+        attr_val_prefix = 'product_configurator.product_attribute_value_%s'
+        value_ids = [
+            [self.env.ref(attr_val_prefix % ext_id).id for ext_id in conf]
+            for conf in [
+                ['gasoline', '228i', 'model_luxury_line', 'silver',
+                 'rims_384', 'tapistry_black', 'steptronic'],
+                ['gasoline', '218i', 'model_luxury_line', 'silver',
+                 'rims_384', 'tapistry_black', 'steptronic'],
+                ['diesel', '220d', 'model_sport_line', 'silver',
+                 'rims_384', 'tapistry_black', 'steptronic'],
+            ]
+        ]
+        variants = cfg_tmpl.create_get_variants([
+            (conf_value_ids, None) for conf_value_ids in value_ids
+        ])
+        first, second = variants[:2]
+
+        # Distinct configurations written at once are accepted
+        (first | second).write({'default_code': 'BULK'})
+        (first | second)._check_duplicate_product()
+
+        with self.assertRaises(ValidationError), self.cr.savepoint():
+            (first | second).write({
+                'attribute_value_ids': [(6, 0, value_ids[2])]
+            })
+        with self.assertRaises(ValidationError), self.cr.savepoint():
+            first.write({'attribute_value_ids': [(6, 0, value_ids[2])]})
+
+    def test_variant_config_image(self):
+        """Test variants share the matching configuration image instead of
+        storing a copy"""
+        cfg_tmpl = self.env.ref('product_configurator.bmw_2_series')
+        attr_val_prefix = 'product_configurator.product_attribute_value_%s'
+        value_ids = [
+            self.env.ref(attr_val_prefix % ext_id).id for ext_id in [
+                'gasoline', '228i', 'model_luxury_line', 'silver',
+                'rims_384', 'tapistry_black', 'steptronic'
+            ]
+        ]
+        config_image = self.env['product.config.image'].create({
+            'name': 'Test Image',
+            'product_tmpl_id': cfg_tmpl.id,
+            'image': (
+                b'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk'
+                b'YPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=='
+            ),
+            'value_ids': [(6, 0, value_ids)],
+            'sequence': 0,
+        })
+        variant = cfg_tmpl.create_get_variant(value_ids)
+        self.assertEqual(variant.config_image_id, config_image)
+        self.assertFalse(variant.image_variant_1920)
+        self.assertEqual(variant.image_1920, config_image.image)
+        self.assertEqual(variant.image_128, config_image.image_128)
+
+    def test_config_image_index(self):
+        """Test the indexed image selection matches a linear scan of the
+        configuration images and supports incremental updates"""
+        cfg_tmpl = self.env.ref('product_configurator.bmw_2_series')
+        attr_val_prefix = 'product_configurator.product_attribute_value_%s'
+        configurations = [
+            [self.env.ref(attr_val_prefix % ext_id).id for ext_id in conf]
+            for conf in [
+                ['gasoline', '228i', 'model_luxury_line', 'silver',
+                 'rims_384', 'tapistry_black', 'steptronic'],
+                ['diesel', '220d', 'model_sport_line', 'silver',
+                 'rims_384', 'tapistry_black', 'steptronic'],
+                ['gasoline'],
+                [],
+            ]
+        ]
+
+        def linear_scan(value_ids):
+            img_obj = cfg_tmpl
+            max_matches = 0
+            for line in cfg_tmpl.config_image_ids:
+                matches = len(set(line.value_ids.ids) & set(value_ids))
+                if matches > max_matches:
+                    img_obj = line
+                    max_matches = matches
+            return img_obj
+
+        for value_ids in configurations:
+            self.assertEqual(
+                cfg_tmpl.get_config_image_obj(value_ids),
+                linear_scan(value_ids))
+
+        index = cfg_tmpl._get_config_image_index(cfg_tmpl.id)
+        counts = index.count(configurations[0])
+        index.update(counts, added=configurations[1],
+                     removed=configurations[0])
+        self.assertEqual(counts, index.count(configurations[1]))
+
+        # Image changes clear the index
+        image = cfg_tmpl.config_image_ids[-1:]
+        image.value_ids = [(6, 0, configurations[1])]
+        self.assertEqual(
+            cfg_tmpl.get_config_image_obj(configurations[1]), image)
+
+    def test_reactivate_duplicate(self):
+        """Test reactivating an archived duplicate variant is refused"""
+        cfg_tmpl = self.env.ref('product_configurator.bmw_2_series')
+        attr_val_prefix = 'product_configurator.product_attribute_value_%s'
+        value_ids = [
+            self.env.ref(attr_val_prefix % ext_id).id for ext_id in [
+                'gasoline', '228i', 'model_luxury_line', 'silver',
+                'rims_384', 'tapistry_black', 'steptronic'
+            ]
+        ]
+        archived = cfg_tmpl.create_get_variant(value_ids)
+        archived.active = False
+        variant = cfg_tmpl.create_get_variant(value_ids)
+        self.assertNotEqual(variant, archived)
+
+        with self.assertRaises(ValidationError), self.cr.savepoint():
+            archived.active = True
@@ -0,0 +1,467 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tests.common import TransactionCase
+
+
+class ConfigurationPricing(TransactionCase):
+
+    def setUp(self):
+        super(ConfigurationPricing, self).setUp()
+        self.cfg_tmpl = self.env.ref('product_configurator.bmw_2_series')
+        self.pricelist = self.env.ref('product.list0')
+
+    def get_attr_val_ids(self, ext_ids):
+        """Return a list of database ids using the external_ids
+        passed via ext_ids argument"""
+        attr_val_prefix = 'product_configurator.product_attribute_value_%s'
+        return [self.env.ref(attr_val_prefix % ext_id).id
+                for ext_id in ext_ids]
+
+    def test_cfg_price_batch(self):
+        """Test batched prices match the prices of single configurations"""
+        configurations = [
+            (self.cfg_tmpl, self.get_attr_val_ids(conf), {})
+            for conf in [
+                ['gasoline', '228i', 'model_luxury_line', 'silver',
+                 'rims_384', 'tapistry_black', 'steptronic', 'smoker_package',
+                 'tow_hook'],
+                ['diesel', '220d', 'model_sport_line', 'silver',
+                 'rims_384', 'tapistry_black', 'steptronic'],
+                ['gasoline', '218i', 'model_luxury_line', 'silver',
+                 'rims_384', 'tapistry_black', 'steptronic'],
+            ]
+        ]
+        batch_prices = self.env['product.template'].get_cfg_price_batch(
+            configurations, pricelist=self.pricelist)
+        self.assertEqual(len(batch_prices), len(configurations))
+        for (tmpl, value_ids, custom_vals), prices in zip(
+                configurations, batch_prices):
+            product = tmpl.with_context(pricelist=self.pricelist.id)
+            base_prices = product.taxes_id.sudo().compute_all(
+                price_unit=product.price,
+                currency=self.pricelist.currency_id,
+                quantity=1,
+                product=product,
+                partner=self.env.user.partner_id
+            )
+            total_included = base_prices['total_included']
+            total_excluded = base_prices['total_excluded']
+            expected = tmpl.get_components_prices({
+                'vals': [('Base', tmpl.name, total_excluded)],
+                'total': total_included,
+                'taxes': total_included - total_excluded,
+                'currency': self.pricelist.currency_id.name,
+            }, value_ids, custom_vals, self.pricelist)
+
+            self.assertEqual(prices['vals'], expected['vals'])
+            self.assertAlmostEqual(prices['total'], expected['total'])
+            self.assertAlmostEqual(prices['taxes'], expected['taxes'])
+            self.assertTrue(len(prices['vals']) > 1,
+                            "Option prices missing from the configuration")
+
+    def test_cfg_price_cache(self):
+        """Test configured prices are cached and invalidated by price
+        changes"""
+        value_ids = self.get_attr_val_ids([
+            'gasoline', '228i', 'model_luxury_line', 'silver', 'rims_384',
+            'tapistry_black', 'steptronic', 'smoker_package', 'tow_hook'
+        ])
+        tmpl_obj = self.env['product.template']
+        tmpl_obj.clear_caches()
+
+        prices = self.cfg_tmpl.get_cfg_price(value_ids, {}, self.pricelist.id)
+        stats = tmpl_obj.get_price_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (0, 1))
+
+        # Same configuration in any order hits the cache
+        cached_prices = self.cfg_tmpl.get_cfg_price(
+            list(reversed(value_ids)), {}, self.pricelist.id)
+        self.assertEqual(cached_prices['total'], prices['total'])
+        self.assertEqual(tmpl_obj.get_price_cache_stats()['hits'], 1)
+
+        # Cached prices are not altered by the callers
+        cached_prices['vals'].append(('Test', 'Test', 1.0))
+        self.assertEqual(
+            self.cfg_tmpl.get_cfg_price(
+                value_ids, {}, self.pricelist.id)['vals'],
+            prices['vals']
+        )
+
+        # Cost changes of products unrelated to configurations keep it
+        other_product = self.env['product.product'].create({
+            'name': 'Unrelated product',
+        })
+        other_product.standard_price = 42.0
+        self.cfg_tmpl.get_cfg_price(value_ids, {}, self.pricelist.id)
+        self.assertEqual(tmpl_obj.get_price_cache_stats()['hits'], 3)
+
+        # Price changes of option products clear the cache, and only it
+        metadata = tmpl_obj._get_configurator_metadata(self.cfg_tmpl.id)
+        option_product = self.env['product.attribute.value'].browse(
+            value_ids).mapped('product_id')[0]
+        option_product.product_tmpl_id.list_price += 100
+        new_prices = self.cfg_tmpl.get_cfg_price(
+            value_ids, {}, self.pricelist.id)
+        self.assertEqual(tmpl_obj.get_price_cache_stats()['hits'], 0)
+        self.assertNotEqual(new_prices['total'], prices['total'])
+        self.assertIs(
+            tmpl_obj._get_configurator_metadata(self.cfg_tmpl.id), metadata)
+
+        # Prices with translated labels are cached per language
+        self.cfg_tmpl.with_context(lang='fr_FR').get_cfg_price(
+            value_ids, {}, self.pricelist.id)
+        stats = tmpl_obj.get_price_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (0, 2))
+
+    def test_components_taxes_rounding(self):
+        """Test component taxes match one compute_all call per component
+        under both rounding methods, which a single call on the summed
+        prices of components sharing their taxes does not"""
+        tax = self.env['account.tax'].create({
+            'name': 'Test 15%',
+            'amount_type': 'percent',
+            'amount': 15.0,
+            'type_tax_use': 'sale',
+            'price_include': False,
+        })
+        currency = self.pricelist.currency_id
+        partner = self.env.user.partner_id
+        prices = [0.03, 0.03, 0.03, 10.005, 0.333]
+        components = [(tax, price, self.cfg_tmpl) for price in prices]
+        tmpl_obj = self.env['product.template']
+
+        for method in ['round_per_line', 'round_globally']:
+            self.env.company.tax_calculation_rounding_method = method
+            expected = [
+                tax.compute_all(
+                    price_unit=price, currency=currency, quantity=1,
+                    product=self.cfg_tmpl, partner=partner)
+                for price in prices
+            ]
+            results = tmpl_obj._compute_components_taxes(
+                components, currency)
+            self.assertEqual(results, expected, method)
+
+            grouped = tax.compute_all(
+                price_unit=sum(prices[:3]), currency=currency, quantity=1,
+                product=self.cfg_tmpl, partner=partner)
+            self.assertNotAlmostEqual(
+                grouped['total_included'],
+                sum(res['total_included'] for res in expected[:3]),
+                msg=method)
+
+    def test_option_price_table(self):
+        """Test option prices are materialized per template and pricelist
+        and dropped when the pricelist changes"""
+        value_ids = self.get_attr_val_ids([
+            'gasoline', '228i', 'model_luxury_line', 'silver', 'rims_384',
+            'tapistry_black', 'steptronic', 'smoker_package', 'tow_hook'
+        ])
+        option_price_obj = self.env['product.config.option.price']
+        domain = [
+            ('product_tmpl_id', '=', self.cfg_tmpl.id),
+            ('pricelist_id', '=', self.pricelist.id),
+        ]
+        prices = self.cfg_tmpl.get_cfg_price(value_ids, {}, self.pricelist.id)
+        rows = option_price_obj.search(domain)
+        self.assertTrue(rows, "Option prices were not materialized")
+        self.assertEqual(
+            set(rows.mapped('value_id').ids),
+            set(self.cfg_tmpl.attribute_line_ids.mapped(
+                'value_ids').filtered('product_id').ids)
+        )
+        option_vals = [
+            (row.value_id.attribute_id.name, row.product_id.name, row.price)
+            for row in rows.sorted(lambda r: value_ids.index(r.value_id.id)
+                                   if r.value_id.id in value_ids else -1)
+            if row.value_id.id in value_ids and row.price
+        ]
+        self.assertEqual(prices['vals'][1:], option_vals)
+
+        self.env['product.pricelist.item'].create({
+            'pricelist_id': self.pricelist.id,
+            'applied_on': '3_global',
+            'compute_price': 'percentage',
+            'percent_price': 10,
+        })
+        self.assertFalse(option_price_obj.search(domain),
+                         "Option prices not dropped on pricelist change")
+
+        option_price_obj._cron_rebuild_option_prices()
+        self.assertTrue(option_price_obj.search(domain))
+
+    def test_option_price_built_once(self):
+        """Test option prices are built once per template, pricelist,
+        company and date, templates without priced options included"""
+        option_price_obj = self.env['product.config.option.price']
+        plain_tmpl = self.env['product.template'].create({
+            'name': 'Plain configurable template',
+            'config_ok': True,
+        })
+        templates = self.cfg_tmpl | plain_tmpl
+        domain = [
+            ('product_tmpl_id', 'in', templates.ids),
+            ('pricelist_id', '=', self.pricelist.id),
+        ]
+        option_price_obj._get_option_prices(templates, self.pricelist)
+        rows = option_price_obj.search(domain)
+        self.assertTrue(rows.filtered(
+            lambda r: r.product_tmpl_id == plain_tmpl and not r.value_id))
+
+        self.assertFalse(
+            option_price_obj._build_option_prices(templates, self.pricelist),
+            "Rows of a built template were inserted again")
+        self.assertFalse(
+            option_price_obj._get_option_prices(plain_tmpl, self.pricelist))
+        self.assertEqual(option_price_obj.search(domain), rows)
+
+    def test_option_price_cron_companies(self):
+        """Test the rebuild cron prices the options of every company"""
+        option_price_obj = self.env['product.config.option.price']
+        company = self.env['res.company'].create({'name': 'Other company'})
+        self.pricelist.company_id = False
+        option_price_obj._cron_rebuild_option_prices()
+        rows = option_price_obj.search([
+            ('product_tmpl_id', '=', self.cfg_tmpl.id),
+            ('pricelist_id', '=', self.pricelist.id),
+        ])
+        self.assertIn(self.env.company, rows.mapped('company_id'))
+        self.assertIn(company, rows.mapped('company_id'))
+
+    def test_bulk_reprice(self):
+        """Test bulk repricing stores the prices computed one by one"""
+        variants = self.env['product.product']
+        for conf in [
+            ['gasoline', '228i', 'model_luxury_line', 'silver', 'rims_384',
+             'tapistry_black', 'steptronic', 'smoker_package', 'tow_hook'],
+            ['gasoline', '218i', 'model_luxury_line', 'silver', 'rims_384',
+             'tapistry_black', 'steptronic'],
+        ]:
+            variants |= self.cfg_tmpl.create_get_variant(
+                self.get_attr_val_ids(conf))
+
+        pricelist = self.env.user.partner_id.property_product_pricelist
+        expected = {}
+        for variant in variants:
+            prices = self.cfg_tmpl.get_cfg_price(
+                variant.attribute_value_ids.ids, {}, pricelist.id)
+            expected[variant.id] = (
+                prices['total'] - prices['taxes'] - self.cfg_tmpl.lst_price)
+
+        variant_price_obj = self.env['product.config.variant.price']
+        variant_price_obj.reprice(products=variants, pricelists=pricelist)
+        stored = variant_price_obj._get_variant_prices(variants, pricelist)
+        self.assertEqual(set(stored), set(variants.ids))
+        for variant in variants:
+            self.assertAlmostEqual(stored[variant.id], expected[variant.id])
+            self.assertAlmostEqual(variant.price_extra, expected[variant.id])
+
+        # Pricelist changes drop the stored prices
+        pricelist.write({'name': pricelist.name})
+        self.assertFalse(
+            variant_price_obj._get_variant_prices(variants, pricelist))
+
+    def _get_repriced_variant(self):
+        """Return a configured variant whose price is stored for the
+        pricelist of the user"""
+        variant = self.cfg_tmpl.create_get_variant(self.get_attr_val_ids([
+            'gasoline', '228i', 'model_luxury_line', 'silver', 'rims_384',
+            'tapistry_black', 'steptronic'
+        ]))
+        pricelist = self.env.user.partner_id.property_product_pricelist
+        variant_price_obj = self.env['product.config.variant.price']
+        variant_price_obj.reprice(products=variant, pricelists=pricelist)
+        self.assertIn(
+            variant.id,
+            variant_price_obj._get_variant_prices(variant, pricelist))
+        return variant, pricelist
+
+    def test_variant_price_mixed(self):
+        """Test price extras of configurable and plain variants computed
+        together match the ones computed apart"""
+        variant = self.cfg_tmpl.create_get_variant(self.get_attr_val_ids([
+            'gasoline', '228i', 'model_luxury_line', 'silver', 'rims_384',
+            'tapistry_black', 'steptronic'
+        ]))
+        plain = self.env.ref('product.product_product_4')
+        self.assertFalse(plain.config_ok)
+        pricelist = self.env.user.partner_id.property_product_pricelist
+        prices = self.cfg_tmpl.get_cfg_price(
+            variant.attribute_value_ids.ids, {}, pricelist.id)
+        expected = {
+            variant.id: (
+                prices['total'] - prices['taxes'] - self.cfg_tmpl.lst_price),
+            plain.id: plain.price_extra,
+        }
+
+        products = variant | plain
+        products.invalidate_cache(['price_extra'])
+        for product in products:
+            self.assertAlmostEqual(product.price_extra, expected[product.id])
+
+    def test_variant_price_reconfigure(self):
+        """Test stored variant prices are dropped when the configuration of
+        the variant changes"""
+        variant, pricelist = self._get_repriced_variant()
+        variant.write({'attribute_value_ids': [(6, 0, self.get_attr_val_ids([
+            'gasoline', '218i', 'model_luxury_line', 'silver', 'rims_384',
+            'tapistry_black', 'steptronic'
+        ]))]})
+        self.assertFalse(self.env[
+            'product.config.variant.price']._get_variant_prices(
+                variant, pricelist))
+
+    def test_variant_price_value_product(self):
+        """Test stored variant prices are dropped when a value without
+        option product gets one"""
+        value = self.env['product.attribute.value'].browse(
+            self.get_attr_val_ids(['silver']))
+        option_product = value.product_id or self.env.ref(
+            'product.product_product_4')
+        value.product_id = False
+        variant, pricelist = self._get_repriced_variant()
+        self.assertFalse(self.env['product.config.option.price'].search([
+            ('value_id', '=', value.id)]))
+
+        value.product_id = option_product
+        self.assertFalse(self.env[
+            'product.config.variant.price']._get_variant_prices(
+                variant, pricelist))
+
+    def test_variant_price_value_unlink(self):
+        """Test stored variant prices are dropped when a value offered by
+        their template is removed"""
+        line = self.cfg_tmpl.attribute_line_ids[0]
+        value = self.env['product.attribute.value'].create({
+            'name': 'Test Value',
+            'attribute_id': line.attribute_id.id,
+        })
+        line.value_ids = [(4, value.id)]
+        variant, pricelist = self._get_repriced_variant()
+
+        value.unlink()
+        self.assertFalse(self.env[
+            'product.config.variant.price']._get_variant_prices(
+                variant, pricelist))
+
+    def test_session_price(self):
+        """Test session prices are computed on read and stored on confirm"""
+        value_ids = self.get_attr_val_ids([
+            'gasoline', '228i', 'model_luxury_line', 'silver', 'rims_384',
+            'tapistry_black', 'steptronic', 'smoker_package', 'tow_hook'
+        ])
+        session = self.env['product.config.session'].create({
+            'product_tmpl_id': self.cfg_tmpl.id,
+            'user_id': self.env.uid,
+            'value_ids': [(6, 0, value_ids)],
+        })
+        price = self.cfg_tmpl.get_cfg_price(value_ids)['total']
+        self.assertAlmostEqual(session.price, price)
+
+        self.cfg_tmpl.config_price_display = False
+        session.invalidate_cache(['price'])
+        self.assertEqual(session.price, 0.0)
+
+        self.cfg_tmpl.config_price_display = True
+        self.assertTrue(session.action_confirm())
+        self.assertAlmostEqual(session.confirmed_price, price)
+        self.assertAlmostEqual(session.price, price)
+
+        # Price changes after the confirmation leave the session price as is
+        self.cfg_tmpl.list_price += 100
+        self.assertNotAlmostEqual(
+            self.cfg_tmpl.get_cfg_price(value_ids)['total'], price)
+        session.invalidate_cache(['price', 'confirmed_price'])
+        self.assertAlmostEqual(session.confirmed_price, price)
+        self.assertAlmostEqual(session.price, price)
+
+    def test_price_trace(self):
+        """Test traced prices match untraced prices and report every
+        component and phase"""
+        value_ids = self.get_attr_val_ids([
+            'gasoline', '228i', 'model_luxury_line', 'silver', 'rims_384',
+            'tapistry_black', 'steptronic', 'smoker_package', 'tow_hook'
+        ])
+        prices = self.cfg_tmpl.get_cfg_price(value_ids, {}, self.pricelist.id)
+        self.assertNotIn('trace', prices)
+
+        traced = self.cfg_tmpl.get_cfg_price(
+            value_ids, {}, self.pricelist.id, trace=True)
+        trace = traced.pop('trace')
+        self.assertEqual(traced, prices)
+
+        self.assertEqual(
+            [phase['name'] for phase in trace['phases']],
+            ['option_table', 'pricelist', 'taxes']
+        )
+        components = trace['components']
+        self.assertEqual(components[0]['source'], 'template')
+        self.assertEqual(
+            [(c['name'], c['price']) for c in components[1:]],
+            [(name, price) for name, product, price in prices['vals'][1:]]
+        )
+        self.assertAlmostEqual(
+            sum(c['total_included'] for c in components), prices['total'])
+
+        # The trace is not served from nor stored in the price cache
+        self.assertNotIn(
+            'trace', self.cfg_tmpl.get_cfg_price(
+                value_ids, {}, self.pricelist.id))
+
+    def test_price_prefetch(self):
+        """Test prices of reachable configurations are prefetched into the
+        price cache"""
+        value_ids = self.get_attr_val_ids([
+            'gasoline', '228i', 'model_luxury_line', 'silver', 'rims_384',
+            'tapistry_black', 'steptronic', 'smoker_package', 'tow_hook'
+        ])
+        tmpl_obj = self.env['product.template']
+        params = self.env['ir.config_parameter'].sudo()
+        tmpl_obj.clear_caches()
+
+        params.set_param('product_configurator.price_prefetch_workers', 0)
+        self.assertFalse(self.cfg_tmpl._schedule_price_prefetch(
+            value_ids, pricelist=self.pricelist))
+        self.assertEqual(tmpl_obj.get_price_cache_stats()['size'], 0)
+
+        params.set_param('product_configurator.price_prefetch_workers', 1)
+        self.assertTrue(self.cfg_tmpl._schedule_price_prefetch(
+            value_ids, pricelist=self.pricelist))
+        reachable = self.cfg_tmpl._get_reachable_configurations(value_ids)
+        self.assertTrue(reachable)
+        stats = tmpl_obj.get_price_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (0, 0))
+        self.assertEqual(stats['size'], len(reachable) + 1)
+
+        for line_id, value_id, reachable_ids in reachable[:3]:
+            self.cfg_tmpl.get_cfg_price(
+                reachable_ids, {}, self.pricelist.id)
+        stats = tmpl_obj.get_price_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (3, 0))
+
+    def test_option_price_deltas(self):
+        """Test option price deltas match the difference of the prices of
+        the configurations computed one by one"""
+        value_ids = self.get_attr_val_ids([
+            'gasoline', '228i', 'model_luxury_line', 'silver', 'rims_384',
+            'tapistry_black', 'steptronic'
+        ])
+        deltas = self.cfg_tmpl.get_option_price_deltas(
+            value_ids, pricelist=self.pricelist)
+        self.assertEqual(
+            set(deltas), set(self.cfg_tmpl.attribute_line_ids.ids))
+
+        total = self.cfg_tmpl.get_cfg_price(
+            value_ids, {}, self.pricelist.id)['total']
+        reachable = self.cfg_tmpl._get_reachable_configurations(value_ids)
+        for line_id, value_id, reachable_ids in reachable:
+            prices = self.cfg_tmpl.get_cfg_price(
+                reachable_ids, {}, self.pricelist.id)
+            self.assertAlmostEqual(
+                deltas[line_id][value_id], prices['total'] - total)
+        selected_deltas = {
+            value_id: delta for line_deltas in deltas.values()
+            for value_id, delta in line_deltas.items()
+            if value_id in value_ids
+        }
+        self.assertEqual(selected_deltas, dict.fromkeys(value_ids, 0.0))
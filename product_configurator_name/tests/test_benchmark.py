@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tests import tagged
+
+from odoo.addons.product_configurator.tests.benchmark import BenchmarkCase
+
+
+@tagged('-standard', 'benchmark')
+class NameBenchmark(BenchmarkCase):
+
+    def test_name_get(self):
+        # No rule tests the last attribute, any of its values is valid
+        variants = self.env['product.product']
+        last_line = self.cfg_tmpl.attribute_line_ids.sorted(
+            lambda l: l.attribute_id.id)[-1]
+        for value in last_line.value_ids:
+            value_ids = [
+                value_id for value_id in self.value_ids
+                if value_id not in last_line.value_ids.ids
+            ] + [value.id]
+            variants |= self.cfg_tmpl.create_get_variant(value_ids)
+        self.measure('name_get', lambda: variants.name_get())
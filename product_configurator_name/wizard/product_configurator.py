@@ -282,8 +282,8 @@ class ProductConfigurator(models.TransientModel):
 
             if attr_line.custom and custom_field in dynamic_fields:
                 widget = ''
-                custom_ext_id = 'product_configurator.custom_attribute_value'
-                custom_option_id = self.env.ref(custom_ext_id).id
+                custom_option_id = wiz._get_configurator_metadata(
+                    ).custom_value_id
 
                 if field_type == 'many2many':
                     field_val = [(6, False, [custom_option_id])]
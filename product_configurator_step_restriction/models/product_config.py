@@ -34,6 +34,7 @@ class ProductTemplate(models.Model):
         """
 
         open_step_lines = self.env['product.config.step.line']
+        avail_val_ids = self.values_available_bulk(value_ids)
 
         for cfg_line in self.config_step_line_ids:
             if not force_all:
@@ -57,8 +58,7 @@ class ProductTemplate(models.Model):
                 if not show_step:
                     continue
             for attr_line in cfg_line.attribute_line_ids:
-                available_vals = self.values_available(attr_line.value_ids.ids,
-                                                       value_ids)
+                available_vals = avail_val_ids.get(attr_line.id)
                 # TODO: Refactor when adding restriction to custom values
                 if available_vals or attr_line.custom:
                     open_step_lines |= cfg_line
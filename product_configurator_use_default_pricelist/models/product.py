@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from odoo.exceptions import ValidationError
-from odoo import models, api, _
+from odoo import models
 
 
 class ProductProduct(models.Model):
@@ -14,41 +13,27 @@ class ProductProduct(models.Model):
         - Extra price For Attribute value
         - Extra price For Custom value.
     """
-    
+
     def _compute_product_price_extra(self):
-        """Compute price of configurable products as sum
-        of products related to attribute values picked"""
+        """Compute price of configurable products as the difference between
+        their pricelist price and the list price of their template. The
+        pricelist prices of all the products are computed at once"""
         products = self.filtered(lambda x: not x.config_ok)
-        pricelist = self.env.user.partner_id.property_product_pricelist
         configurable_products = self - products
         if products:
-            prices = super(ProductProduct, self)._compute_product_price_extra()
+            super(ProductProduct, products)._compute_product_price_extra()
+        if not configurable_products:
+            return
 
-        conversions = self._get_conversions_dict()
+        partner = self.env.user.partner_id
+        pricelist = partner.property_product_pricelist
+        nr_products = len(configurable_products)
+        # {product_id: (price, pricelist item id)}
+        prices = pricelist._compute_price_rule(list(zip(
+            configurable_products, [1.0] * nr_products,
+            [partner] * nr_products
+        )))
         for product in configurable_products:
             lst_price = product.product_tmpl_id.lst_price
-            value_ids = product.attribute_value_ids.ids
-            # TODO: Merge custom values from products with cfg session
-            # and use same method to retrieve parsed custom val dict
-            custom_vals = {}
-            for val in product.value_custom_ids:
-                custom_type = val.attribute_id.custom_type
-                if custom_type in conversions:
-                    try:
-                        custom_vals[val.attribute_id.id] = conversions[
-                            custom_type](val.value)
-                    except:
-                        raise ValidationError(
-                            _("Could not convert custom value '%s' to '%s' on "
-                              "product variant: '%s'" % (val.value,
-                                                         custom_type,
-                                                         product.display_name))
-                        )
-                else:
-                    custom_vals[val.attribute_id.id] = val.value
-            #
-            # prices = product.product_tmpl_id.get_cfg_price(
-            #     value_ids, custom_vals)
-            product_price = pricelist.get_product_price(product, 1, 1)
-            # product.price_extra = prices['total'] - prices['taxes'] - lst_price
-            product.price_extra = product_price - lst_price
\ No newline at end of file
+            product_price = prices.get(product.id, (0.0, False))[0]
+            product.price_extra = product_price - lst_price
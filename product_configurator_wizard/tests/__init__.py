@@ -1,3 +1,4 @@
 # -*- coding: utf-8 -*-
 
 from . import test_wizard
+from . import test_benchmark
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tests import tagged
+
+from odoo.addons.product_configurator.tests.benchmark import BenchmarkCase
+
+
+@tagged('-standard', 'benchmark')
+class WizardBenchmark(BenchmarkCase):
+
+    def setUp(self):
+        super(WizardBenchmark, self).setUp()
+        self.wizard = self.env['product.configurator'].create({
+            'product_tmpl_id': self.cfg_tmpl.id
+        })
+        self.wizard.action_next_step()
+        self.field_values = {
+            self.wizard.field_prefix + str(line.attribute_id.id):
+                line.value_ids[0].id
+            for line in self.cfg_tmpl.attribute_line_ids
+        }
+
+    def test_onchange(self):
+        line = self.cfg_tmpl.attribute_line_ids[0]
+        field_name = self.wizard.field_prefix + str(line.attribute_id.id)
+        values = dict(self.field_values, id=self.wizard.id)
+        self.measure(
+            'onchange',
+            lambda: self.wizard.onchange(values, field_name, {}))
+
+    def test_fields_view_get(self):
+        wizard_obj = self.wizard.with_context(wizard_id=self.wizard.id)
+        self.measure(
+            'fields_view_get',
+            lambda: wizard_obj.fields_view_get(view_type='form'))
+
+    def test_read(self):
+        self.wizard.write(self.field_values)
+        field_names = list(self.field_values)
+        self.measure('read', lambda: self.wizard.read(field_names))
+
+    def test_write(self):
+        self.measure('write', lambda: self.wizard.write(self.field_values))
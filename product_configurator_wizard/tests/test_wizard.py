@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+from lxml import etree
+
 from odoo.tests.common import TransactionCase
 
 
@@ -169,3 +171,135 @@ class ConfigurationRules(TransactionCase):
             set(gasoline_engine_vals.ids),
             "Engine domain value not set correctly by onchange wizard"
         )
+
+    def test_wizard_static_fields(self):
+        """Test dynamic field descriptors do not depend on the configuration
+        and domains are applied when the view is loaded"""
+        wizard = self.env['product.configurator'].create({
+            'product_tmpl_id': self.cfg_tmpl.id
+        })
+        wizard_obj = wizard.with_context(wizard_id=wizard.id)
+        field_name = '%s%s' % (
+            wizard.field_prefix,
+            self.env.ref('product_configurator.product_attribute_engine').id
+        )
+
+        fields_before = wizard_obj.fields_get()
+        self.assertEqual(fields_before[field_name]['domain'], [])
+
+        attr_vals = self.get_attr_values(['gasoline'])
+        wizard.write(self.get_wizard_write_dict(wizard, attr_vals))
+        fields_after = wizard_obj.fields_get()
+        self.assertEqual(
+            fields_before[field_name], fields_after[field_name],
+            "Dynamic field descriptors changed with the configuration"
+        )
+
+        view = wizard_obj.fields_view_get(view_type='form')
+        domain = view['fields'][field_name]['domain']
+        gasoline_engine_vals = self.env.ref(
+            'product_configurator.product_config_line_gasoline_engines'
+        ).value_ids
+        self.assertEqual(set(domain[0][2]), set(gasoline_engine_vals.ids))
+
+    def test_wizard_dynamic_view_cache(self):
+        """Test the cached configuration form is built again when the
+        attribute lines of the template change"""
+        wizard = self.env['product.configurator'].create({
+            'product_tmpl_id': self.cfg_tmpl.id
+        })
+        wizard_obj = wizard.with_context(wizard_id=wizard.id)
+        attr_line = self.cfg_tmpl.attribute_line_ids.filtered(
+            lambda l: not l.required)[:1]
+        self.assertTrue(attr_line)
+        field_name = '%s%s' % (wizard.field_prefix, attr_line.attribute_id.id)
+
+        def get_modifiers():
+            arch = etree.fromstring(
+                wizard_obj.fields_view_get(view_type='form')['arch'])
+            return arch.xpath(
+                "//field[@name='%s']" % field_name)[0].get('modifiers')
+
+        wizard.action_next_step()
+        self.assertNotEqual(wizard.state, 'select')
+        step_modifiers = get_modifiers()
+        self.assertEqual(get_modifiers(), step_modifiers)
+
+        # Attribute line changes clear the cached form
+        attr_line.required = True
+        self.assertNotEqual(get_modifiers(), step_modifiers)
+
+    def test_wizard_option_price_deltas(self):
+        """Test the wizard returns the price deltas of the values of the
+        active step"""
+        wizard = self.env['product.configurator'].create({
+            'product_tmpl_id': self.cfg_tmpl.id
+        })
+        self.assertEqual(wizard.get_option_price_deltas(), {})
+        wizard.action_next_step()
+
+        attr_vals = self.get_attr_values(['gasoline', '228i'])
+        wizard.write(self.get_wizard_write_dict(wizard, attr_vals))
+        deltas = wizard.get_option_price_deltas()
+        field_name = '%s%s' % (
+            wizard.field_prefix,
+            self.env.ref('product_configurator.product_attribute_engine').id
+        )
+        self.assertIn(field_name, deltas)
+        self.assertEqual(
+            deltas[field_name][self.get_attr_values(['228i']).id], 0.0)
+
+    def test_wizard_onchange_dependent_chain(self):
+        """Test onchange clears the values invalidated through a chain of
+        dependent attributes as a full recomputation would"""
+        wizard = self.env['product.configurator'].create({
+            'product_tmpl_id': self.cfg_tmpl.id
+        })
+        values = {'id': wizard.id}
+        for attribute_line in self.cfg_tmpl.attribute_line_ids:
+            field_name = '%s%s' % (
+                wizard.field_prefix,
+                attribute_line.attribute_id.id
+            )
+            values[field_name] = [] if attribute_line.multi else False
+
+        # Fuel restricts the engines which restrict the model lines
+        fuel_field, engine_field, model_line_field = [
+            '%s%s' % (wizard.field_prefix, self.env.ref(
+                'product_configurator.product_attribute_%s' % attr).id)
+            for attr in ['fuel', 'engine', 'model_line']
+        ]
+        attr_vals = self.get_attr_values(
+            ['diesel', '228i', 'model_luxury_line'])
+        values.update(self.get_wizard_write_dict(wizard, attr_vals))
+        oc_result = wizard.onchange(values, fuel_field, {})
+        self.assertIn(engine_field, oc_result['value'])
+        self.assertFalse(oc_result['value'][engine_field])
+        self.assertIn(model_line_field, oc_result['value'])
+        self.assertFalse(oc_result['value'][model_line_field])
+
+        # Recomputing the whole configuration changes nothing
+        values.update(oc_result['value'])
+        dynamic_fields = {}
+        cfg_val_ids = []
+        for k, v in values.items():
+            if not k.startswith(wizard.field_prefix):
+                continue
+            if isinstance(v, list):
+                dynamic_fields[k] = v
+                cfg_val_ids.extend(v and v[0][2])
+            elif v:
+                dynamic_fields[k] = (v, '')
+                cfg_val_ids.append(v)
+            else:
+                dynamic_fields[k] = v
+        domains = wizard.get_onchange_domains(values, cfg_val_ids)
+        for field_name, domain in domains.items():
+            self.assertEqual(
+                set(oc_result['domain'][field_name][0][2]),
+                set(domain[0][2]),
+                "Domain of %s differs from a full recomputation" % field_name
+            )
+        self.assertFalse(wizard.get_form_vals(
+            dynamic_fields, domains, self.env['product.config.step.line'],
+            field_names=set(domains)))
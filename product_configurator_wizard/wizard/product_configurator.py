@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 
+from collections import OrderedDict
+
 from lxml import etree
 
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import ValidationError
 from odoo.addons.base.models.ir_ui_view import (
     transfer_field_to_modifiers,
@@ -118,40 +120,49 @@ class ProductConfigurator(models.TransientModel):
                   'configuration will erase reset/clear all values')
             )
 
-    def get_onchange_domains(self, values, cfg_val_ids):
+    def _get_configurator_metadata(self):
+        """Return the cached configuration metadata of the wizard template"""
+        template = self.product_tmpl_id
+        return template._get_configurator_metadata(template.id)
+
+    def get_onchange_domains(self, values, cfg_val_ids, attr_line_ids=None):
         """Generate domains to be returned by onchange method in order
         to restrict the availble values of dynamically inserted fields
 
         :param values: values argument passed to onchance wrapper
         :cfg_val_ids: current configuration passed as a list of value_ids
         (usually in the form of db value_ids + interface value_ids)
+        :attr_line_ids: optional list of attribute line ids to restrict the
+        generated domains to
 
         :returns: a dictionary of domains returned by onchance method
         """
         domains = {}
-        for line in self.product_tmpl_id.attribute_line_ids.sorted():
-            field_name = self.field_prefix + str(line.attribute_id.id)
+        metadata = self._get_configurator_metadata()
+        avail_val_ids = self.product_tmpl_id.values_available_bulk(
+            cfg_val_ids, attr_line_ids)
+        for line in metadata.attribute_lines:
+            field_name = self.field_prefix + str(line.attribute_id)
 
-            if field_name not in values:
+            if field_name not in values or line.id not in avail_val_ids:
                 continue
 
             vals = values[field_name]
 
             # get available values
-            avail_ids = self.product_tmpl_id.values_available(
-                line.value_ids.ids, cfg_val_ids)
+            avail_ids = list(avail_val_ids.get(line.id, []))
             domains[field_name] = [('id', 'in', avail_ids)]
 
             # Include custom value in the domain if attr line permits it
             if line.custom:
-                custom_ext_id = 'product_configurator.custom_attribute_value'
-                custom_val = self.env.ref(custom_ext_id)
-                domains[field_name][0][2].append(custom_val.id)
-                if line.multi and vals and custom_val.id in vals[0][2]:
+                custom_val_id = metadata.custom_value_id
+                domains[field_name][0][2].append(custom_val_id)
+                if line.multi and vals and custom_val_id in vals[0][2]:
                     continue
         return domains
 
-    def get_form_vals(self, dynamic_fields, domains, cfg_step):
+    def get_form_vals(self, dynamic_fields, domains, cfg_step,
+                      field_names=None):
         """Generate a dictionary to return new values via onchange method.
         Domains hold the values available, this method enforces these values
         if a selection exists in the view that is not available anymore.
@@ -160,6 +171,8 @@ class ProductConfigurator(models.TransientModel):
 
         :param dynamic_fields: Dictionary with the current {dynamic_field: val}
         :param domains: Odoo domains restricting attribute values
+        :param field_names: optional set of dynamic fields to process, all
+                            dynamic fields are still used as configuration
 
         :returns vals: Dictionary passed to {'value': vals} by onchange method
         """
@@ -169,10 +182,16 @@ class ProductConfigurator(models.TransientModel):
 
         # validate and eliminate values, and set defaults if they are on the
         # current step
-        step_val_ids = cfg_step and \
-            cfg_step.attribute_line_ids.mapped('value_ids').ids or \
-            self.product_tmpl_id.attribute_line_ids.mapped('value_ids').ids
+        metadata = self._get_configurator_metadata()
+        step_line_ids = set(cfg_step.attribute_line_ids.ids)
+        step_val_ids = [
+            value_id for line in metadata.attribute_lines
+            if not cfg_step or line.id in step_line_ids
+            for value_id in line.value_ids
+        ]
         for k, v in dynamic_fields.items():
+            if field_names is not None and k not in field_names:
+                continue
             available_val_ids = domains[k][0][2]
             # Get this fresh every time as the loop can change the values as
             # it goes!
@@ -295,13 +314,18 @@ class ProductConfigurator(models.TransientModel):
                              for k, v in vals.items()
                              if k in dynamic_fields}
 
+        # Propagate modified values only to the attribute lines whose rules
+        # depend on the modified attributes until nothing changes anymore
+        rules = self.product_tmpl_id._get_config_rules(
+            self.product_tmpl_id.id)
         while modified_dynamics:
             # modified values may change domains!
             dynamic_fields.update(modified_dynamics)
+            modified_attr_ids = set()
             for k, v in modified_dynamics.items():
                 attr_id = int(k.split(self.field_prefix)[1])
-                view_val_ids -= set(self.env['product.attribute.value'].search(
-                    [('attribute_id', '=', attr_id)]).ids)
+                modified_attr_ids.add(attr_id)
+                view_val_ids -= rules.attribute_values.get(attr_id, set())
                 if v:
                     if isinstance(v, list):
                         view_val_ids |= set(v[0][2])
@@ -312,8 +336,15 @@ class ProductConfigurator(models.TransientModel):
 
             cfg_val_ids = cfg_vals.ids + list(view_val_ids)
 
-            domains = self.get_onchange_domains(values, cfg_val_ids)
-            nvals = self.get_form_vals(dynamic_fields, domains, cfg_step)
+            dependent_line_ids = rules.get_dependent_lines(modified_attr_ids)
+            if not dependent_line_ids:
+                break
+            dependent_domains = self.get_onchange_domains(
+                values, cfg_val_ids, dependent_line_ids)
+            domains.update(dependent_domains)
+            nvals = self.get_form_vals(
+                dynamic_fields, domains, cfg_step,
+                field_names=set(dependent_domains))
             # Stop possible recursion by not including values which have
             # previously looped
             modified_dynamics = {k: v
@@ -358,50 +389,55 @@ class ProductConfigurator(models.TransientModel):
         readonly=True,
     )
 
-    @api.model
-    def fields_get(self, allfields=None, attributes=None):
-        """ Artificially inject fields which are dynamically created using the
-        attribute_ids on the product.template as reference"""
-        res = super(ProductConfigurator, self).fields_get(
-            allfields=allfields,
-            attributes=attributes
-        )
-
-        wizard_id = self.env.context.get('wizard_id')
-
-        # If wizard_id is not defined in the context then the wizard was just
-        # launched and is not stored in the database yet
-        if not wizard_id:
-            return res
-
-        # Get the wizard object from the database
-        wiz = self.browse(wizard_id)
-        active_step_id = wiz.state
-
-        # If the product template is not set it is still at the 1st step
-        if not wiz.product_tmpl_id:
-            return res
-
-        cfg_step_lines = wiz.product_tmpl_id.config_step_line_ids
-
-        try:
-            # Get only the attribute lines for the next step if defined
-            active_step_line = cfg_step_lines.filtered(
-                lambda l: l.id == int(active_step_id))
-            if active_step_line:
-                attribute_lines = active_step_line.attribute_line_ids
-            else:
-                attribute_lines = wiz.product_tmpl_id.attribute_line_ids
-        except:
-            # If no configuration steps exist then get all attribute lines
-            attribute_lines = wiz.product_tmpl_id.attribute_line_ids
-
-        # TODO: If last block is attempting to be clever, this next
-        # line is ignoring it.  Need to determine what is best.
-        attribute_lines = wiz.product_tmpl_id.attribute_line_ids
+    def _get_active_attr_line_ids(self):
+        """Return the ids of the attribute lines of the active step or None
+        when the wizard is not on a configuration step"""
+        metadata = self._get_configurator_metadata()
+        for step_line in metadata.step_lines:
+            if str(step_line.id) == self.state:
+                return step_line.attribute_line_ids
+        return None
+
+    def _get_dynamic_domains(self, attr_line_ids=None):
+        """Return the domains restricting the dynamic fields to the values
+        available given the current configuration of the wizard
+
+        :param attr_line_ids: optional list of attribute line ids to restrict
+                              the evaluation to
+        :returns: dictionary {dynamic_field: domain}
+        """
+        metadata = self._get_configurator_metadata()
+        avail_val_ids = self.product_tmpl_id.values_available_bulk(
+            self.value_ids.ids, attr_line_ids)
+        domains = {}
+        for line in metadata.attribute_lines:
+            if line.id not in avail_val_ids:
+                continue
+            value_ids = list(avail_val_ids[line.id])
+            # If attribute lines allows custom values add the
+            # generic "Custom" attribute.value to the list of options
+            if line.custom:
+                value_ids.append(metadata.custom_value_id)
+            field_name = self.field_prefix + str(line.attribute_id)
+            domains[field_name] = [('id', 'in', value_ids)]
+        return domains
 
-        # Generate relational fields with domains restricting values to
-        # the corresponding attributes
+    @api.model
+    @tools.ormcache('tmpl_id', 'self.env.lang')
+    def _get_dynamic_fields(self, tmpl_id):
+        """Return the descriptors of the dynamic fields of the template.
+        Descriptors do not depend on the configuration: the domains
+        restricting the available values are returned by the onchange and
+        applied when the view is loaded
+
+        :returns: dictionary {dynamic_field: descriptor}
+        """
+        metadata = self.env['product.template']._get_configurator_metadata(
+            tmpl_id)
+        attributes = self.env['product.attribute'].browse([
+            line.attribute_id for line in metadata.attribute_lines
+        ])
+        attr_names = {attribute.id: attribute.name for attribute in attributes}
 
         # Default field attributes
         default_attrs = {
@@ -419,26 +455,19 @@ class ProductConfigurator(models.TransientModel):
             'store' : True,
         }
 
-        for line in attribute_lines:
-            attribute = line.attribute_id
-            value_ids = line.value_ids.ids
-
-            value_ids = wiz.product_tmpl_id.values_available(
-                value_ids, wiz.value_ids.ids)
+        res = {}
+        for line in metadata.attribute_lines:
+            attr_id = str(line.attribute_id)
 
             # If attribute lines allows custom values add the
             # generic "Custom" attribute.value to the list of options
             if line.custom:
-                custom_ext_id = 'product_configurator.custom_attribute_value'
-                custom_val = self.env.ref(custom_ext_id)
-                value_ids.append(custom_val.id)
-
                 # Set default field type
                 field_type = 'char'
                 # FIX-11 _get_field_types() removed, using FIELD_TYPES
 
-                if attribute.custom_type:
-                    custom_type = line.attribute_id.custom_type
+                if line.custom_type:
+                    custom_type = line.custom_type
                     # TODO: Rename int to integer in values
                     if custom_type == 'int':
                         field_type = 'integer'
@@ -446,7 +475,7 @@ class ProductConfigurator(models.TransientModel):
                         field_type = custom_type
 
                 # TODO: Implement custom string on custom attribute
-                res[self.custom_field_prefix + str(attribute.id)] = dict(
+                res[self.custom_field_prefix + attr_id] = dict(
                     default_attrs,
                     string="Custom",
                     type=field_type,
@@ -455,15 +484,44 @@ class ProductConfigurator(models.TransientModel):
 
             # Add the dynamic field to the resultset using the convention
             # "__attribute-DBID" to later identify and extract it
-            res[self.field_prefix + str(attribute.id)] = dict(
+            res[self.field_prefix + attr_id] = dict(
                 default_attrs,
                 type='many2many' if line.multi else 'many2one',
-                domain=[('id', 'in', value_ids)],
-                string=line.attribute_id.name,
+                string=attr_names.get(line.attribute_id),
                 relation='product.attribute.value',
                 sequence=line.sequence,
             )
+        return res
+
+    @api.model
+    def fields_get(self, allfields=None, attributes=None):
+        """ Artificially inject fields which are dynamically created using the
+        attribute_ids on the product.template as reference"""
+        res = super(ProductConfigurator, self).fields_get(
+            allfields=allfields,
+            attributes=attributes
+        )
+
+        wizard_id = self.env.context.get('wizard_id')
+
+        # If wizard_id is not defined in the context then the wizard was just
+        # launched and is not stored in the database yet
+        if not wizard_id:
+            return res
+
+        # Get the wizard object from the database
+        wiz = self.browse(wizard_id)
+
+        # If the product template is not set it is still at the 1st step
+        if not wiz.product_tmpl_id:
+            return res
 
+        # Fields of every step are part of the view, values available are
+        # restricted through the onchange and fields_view_get
+        dynamic_fields = self._get_dynamic_fields(wiz.product_tmpl_id.id)
+        res.update({
+            k: dict(v) for k, v in dynamic_fields.items()
+        })
         return res
 
     @api.model
@@ -483,41 +541,67 @@ class ProductConfigurator(models.TransientModel):
 
         wiz = self.browse(wizard_id)
 
-        # Get updated fields including the dynamic ones
-        fields = self.fields_get()
-        dynamic_fields = {
-            k: v for k, v in fields.items() if k.startswith(
-                self.field_prefix) or k.startswith(self.custom_field_prefix)
-        }
+        # The structure of the form only depends on the template, the active
+        # step and the base view, the values of the wizard are applied
+        # afterwards
+        arch, dynamic_fields = self._get_dynamic_view(res, wiz)
+        # Only the values of the active step need to be restricted
+        dynamic_fields = {k: dict(v) for k, v in dynamic_fields.items()}
+        active_domains = wiz._get_dynamic_domains(
+            wiz._get_active_attr_line_ids())
+        for k, domain in active_domains.items():
+            if k in dynamic_fields:
+                dynamic_fields[k]['domain'] = domain
 
         res['fields'].update(dynamic_fields)
-        mod_view = self.add_dynamic_fields(res, dynamic_fields, wiz)
 
         # Update result dict from super with modified view
-        res.update({'arch': etree.tostring(mod_view)})
+        res.update({'arch': arch})
 
         # set any default values
-        wiz_vals = wiz.read(dynamic_fields.keys())[0]
+        wiz_vals = wiz.read(list(dynamic_fields.keys()))[0]
         dynamic_field_vals = {
             k: wiz_vals.get(
                 k, [] if v['type'] == 'many2many' else False
                 )
-            for k, v in fields.items()
+            for k, v in dynamic_fields.items()
             if k.startswith(self.field_prefix)
         }
-        domains = {k: dynamic_fields[k]['domain']
-                   for k in dynamic_field_vals.keys()}
         try:
             cfg_step_id = int(wiz.state)
             cfg_step = wiz.product_tmpl_id.config_step_line_ids.filtered(
                 lambda x: x.id == cfg_step_id)
         except:
             cfg_step = self.env['product.config.step.line']
-        vals = wiz.get_form_vals(dynamic_field_vals, domains, cfg_step)
+        vals = wiz.get_form_vals(
+            dynamic_field_vals, active_domains, cfg_step,
+            field_names=set(active_domains))
         if vals:
             wiz.write(vals)
         return res
 
+    @api.model
+    @tools.ormcache('wiz.product_tmpl_id.id', 'wiz.state', "res['view_id']",
+                    'self.env.lang',
+                    'tuple(sorted(self.env.user.groups_id.ids))')
+    def _get_dynamic_view(self, res, wiz):
+        """Build the configuration form of wiz from the view returned by
+        super in res. The result only depends on the template and active
+        step of wiz and on the base view, postprocessed for the language and
+        groups of the user: it is kept in the registry cache under those and
+        cleared on view or configuration data changes
+
+        :returns: tuple (arch, {dynamic_field: descriptor})
+        """
+        fields = self.fields_get()
+        dynamic_fields = {
+            k: v for k, v in fields.items()
+            if k.startswith(self.field_prefix) or
+            k.startswith(self.custom_field_prefix)
+        }
+        mod_view = self.add_dynamic_fields(res, dynamic_fields, wiz)
+        return etree.tostring(mod_view), dynamic_fields
+
     @api.model
     def add_dynamic_fields(self, res, dynamic_fields, wiz):
         """ Create the configuration view using the dynamically generated
@@ -544,13 +628,16 @@ class ProductConfigurator(models.TransientModel):
                   '(dynamic_form not found)')
             )
 
-        # Get all dynamic fields inserted via fields_get method
-        attr_lines = wiz.product_tmpl_id.attribute_line_ids.sorted()
+        # The form is cached by _get_dynamic_view(), it is built from the
+        # configuration metadata of the template and the step of wiz only
+        metadata = wiz._get_configurator_metadata()
+        state = wiz.state
+        attr_lines = metadata.attribute_lines
 
         # Loop over the dynamic fields and add them to the view one by one
         for attr_line in attr_lines:
 
-            attribute_id = attr_line.attribute_id.id
+            attribute_id = attr_line.attribute_id
             field_name = self.field_prefix + str(attribute_id)
             custom_field = self.custom_field_prefix + str(attribute_id)
 
@@ -558,8 +645,10 @@ class ProductConfigurator(models.TransientModel):
             if field_name not in dynamic_fields:
                 continue
 
-            config_steps = wiz.product_tmpl_id.config_step_line_ids.filtered(
-                lambda x: attr_line in x.attribute_line_ids)
+            config_steps = [
+                step_line for step_line in metadata.step_lines
+                if attr_line.id in step_line.attribute_line_ids
+            ]
 
             # attrs property for dynamic fields
             attrs = {
@@ -569,7 +658,7 @@ class ProductConfigurator(models.TransientModel):
             }
 
             if config_steps:
-                cfg_step_ids = [str(id) for id in config_steps.ids]
+                cfg_step_ids = [str(step.id) for step in config_steps]
                 attrs['invisible'].append(('state', 'not in', cfg_step_ids))
                 attrs['readonly'].append(('state', 'not in', cfg_step_ids))
 
@@ -581,35 +670,43 @@ class ProductConfigurator(models.TransientModel):
                 pass
                 # TODO: Implement restrictions for ranges
 
-            config_lines = wiz.product_tmpl_id.config_line_ids
-            dependencies = config_lines.filtered(
-                lambda cl: cl.attribute_line_id == attr_line)
+            dependencies = [
+                config_line for config_line in metadata.config_lines
+                if config_line.attribute_line_id == attr_line.id
+            ]
+            dependency_val_ids = set()
+            for config_line in dependencies:
+                dependency_val_ids.update(config_line.value_ids)
 
             # If an attribute field depends on another field from the same
             # configuration step then we must use attrs to enable/disable the
             # required and readonly depending on the value entered in the
             # dependee
 
-            if attr_line.value_ids <= dependencies.mapped('value_ids'):
+            if set(attr_line.value_ids) <= dependency_val_ids:
                 attr_depends = {}
-                domain_lines = dependencies.mapped('domain_id.domain_line_ids')
-                for domain_line in domain_lines:
-                    attr_id = domain_line.attribute_id.id
+                domain_lines = OrderedDict(
+                    (domain_line.id, domain_line)
+                    for config_line in dependencies
+                    for domain_line in config_line.domain_lines
+                )
+                for domain_line in domain_lines.values():
+                    attr_id = domain_line.attribute_id
                     attr_field = self.field_prefix + str(attr_id)
-                    attr_lines = wiz.product_tmpl_id.attribute_line_ids
                     # If the fields it depends on are not in the config step
-                    if config_steps and str(attr_line.id) != wiz.state:
+                    if config_steps and str(attr_line.id) != state:
                         continue
                     if attr_field not in attr_depends:
                         attr_depends[attr_field] = set()
                     if domain_line.condition == 'in':
-                        attr_depends[attr_field] |= set(
-                            domain_line.value_ids.ids)
+                        attr_depends[attr_field] |= set(domain_line.value_ids)
                     elif domain_line.condition == 'not in':
-                        val_ids = attr_lines.filtered(
-                            lambda l: l.attribute_id.id == attr_id).value_ids
-                        val_ids = val_ids - domain_line.value_ids
-                        attr_depends[attr_field] |= set(val_ids.ids)
+                        val_ids = set()
+                        for line in attr_lines:
+                            if line.attribute_id == attr_id:
+                                val_ids.update(line.value_ids)
+                        val_ids -= set(domain_line.value_ids)
+                        attr_depends[attr_field] |= val_ids
 
                 for dependee_field, val_ids in attr_depends.items():
                     if not val_ids:
@@ -628,8 +725,8 @@ class ProductConfigurator(models.TransientModel):
                 attrs=str(attrs),
                 context="{'show_attribute': False}",
                 options=str({
-                    'no_create': not attr_line.attribute_id.create_on_the_fly,
-                    'no_create_edit': not attr_line.attribute_id.create_on_the_fly,
+                    'no_create': not attr_line.create_on_the_fly,
+                    'no_create_edit': not attr_line.create_on_the_fly,
                     'no_open': True
                 })
             )
@@ -643,13 +740,12 @@ class ProductConfigurator(models.TransientModel):
 
             # Apply the modifiers (attrs) on the newly inserted field in the
             # arch and add it to the view
-            orm.setup_modifiers(node)
+            self.setup_modifiers(node)
             xml_dynamic_form.append(node)
 
             if attr_line.custom and custom_field in dynamic_fields:
                 widget = ''
-                custom_ext_id = 'product_configurator.custom_attribute_value'
-                custom_option_id = self.env.ref(custom_ext_id).id
+                custom_option_id = metadata.custom_value_id
 
                 if field_type == 'many2many':
                     field_val = [(6, False, [custom_option_id])]
@@ -664,7 +760,7 @@ class ProductConfigurator(models.TransientModel):
                     attrs['required'] += [('state', 'in', cfg_step_ids)]
 
                 # TODO: Add a field2widget mapper
-                if attr_line.attribute_id.custom_type == 'color':
+                if attr_line.custom_type == 'color':
                     widget = 'color'
                 node = etree.Element(
                     "field",
@@ -672,7 +768,7 @@ class ProductConfigurator(models.TransientModel):
                     attrs=str(attrs),
                     widget=widget
                 )
-                orm.setup_modifiers(node)
+                self.setup_modifiers(node)
                 xml_dynamic_form.append(node)
 
         return xml_view
@@ -713,16 +809,18 @@ class ProductConfigurator(models.TransientModel):
         dynamic_fields = attr_vals + custom_attr_vals
         fields = [f for f in fields if f not in dynamic_fields]
 
-        custom_ext_id = 'product_configurator.custom_attribute_value'
-        custom_val = self.env.ref(custom_ext_id)
-
         res = super(ProductConfigurator, self).read(fields=fields, load=load)
 
-        if not dynamic_fields:
+        if not dynamic_fields or not self.product_tmpl_id:
             return res
 
-        for attr_line in self.product_tmpl_id.attribute_line_ids:
-            attr_id = attr_line.attribute_id.id
+        metadata = self._get_configurator_metadata()
+        value_obj = self.env['product.attribute.value']
+        custom_val = value_obj.browse(metadata.custom_value_id)
+        cfg_val_ids = set(self.value_ids.ids)
+
+        for attr_line in metadata.attribute_lines:
+            attr_id = attr_line.attribute_id
             field_name = self.field_prefix + str(attr_id)
 
             if field_name not in dynamic_fields:
@@ -736,8 +834,9 @@ class ProductConfigurator(models.TransientModel):
             # - m2o expects (1, 'name')
             #   nothing to display
             dynamic_vals = {}
-            vals = attr_line.value_ids.filtered(
-                lambda v: v in self.value_ids)
+            vals = value_obj.browse([
+                v for v in attr_line.value_ids if v in cfg_val_ids
+            ])
 
             # set custom value
             if attr_line.custom:
@@ -745,14 +844,9 @@ class ProductConfigurator(models.TransientModel):
                 custom_vals = self.custom_value_ids.filtered(
                     lambda x: x.attribute_id.id == attr_id)
 
-                if attr_line.attribute_id.custom_type == 'binary':
-                    dynamic_vals.update({
-                        custom_field_name: custom_vals.eval()
-                    })
-                else:
-                    dynamic_vals.update({
-                        custom_field_name: custom_vals.eval()
-                    })
+                dynamic_vals.update({
+                    custom_field_name: custom_vals.eval()
+                })
                 if custom_vals:
                     # override field value
                     vals = custom_val
@@ -783,14 +877,14 @@ class ProductConfigurator(models.TransientModel):
 
         # Get current database value_ids (current configuration)
 
-        custom_ext_id = 'product_configurator.custom_attribute_value'
-        custom_val = self.env.ref(custom_ext_id)
+        metadata = self._get_configurator_metadata()
+        custom_val_id = metadata.custom_value_id
 
         attr_val_dict = {}
         custom_val_dict = {}
 
-        for attr_line in self.product_tmpl_id.attribute_line_ids:
-            attr_id = attr_line.attribute_id.id
+        for attr_line in metadata.attribute_lines:
+            attr_id = attr_line.attribute_id
             field_name = self.field_prefix + str(attr_id)
             custom_field_name = self.custom_field_prefix + str(attr_id)
 
@@ -800,7 +894,7 @@ class ProductConfigurator(models.TransientModel):
             # Add attribute values from the client except custom attribute
             # If a custom value is being written, but field name is not in
             #   the write dictionary, then it must be a custom value!
-            if vals.get(field_name, custom_val.id) != custom_val.id:
+            if vals.get(field_name, custom_val_id) != custom_val_id:
                 if attr_line.multi and isinstance(vals[field_name], list):
                     if not vals[field_name]:
                         field_val = None
@@ -812,9 +906,10 @@ class ProductConfigurator(models.TransientModel):
                     # patch for fields_view_get()
                     field_val = vals[field_name][0]
                 else:
+                    attribute = self.env['product.attribute'].browse(attr_id)
                     raise Warning(
                         _('An error occurred while parsing value for '
-                          'attribute %s' % attr_line.attribute_id.name)
+                          'attribute %s' % attribute.name)
                     )
                 attr_val_dict.update({
                     attr_id: field_val
@@ -825,7 +920,7 @@ class ProductConfigurator(models.TransientModel):
                     custom_val_dict.update({attr_id: False})
             elif attr_line.custom:
                 val = vals.get(custom_field_name, False)
-                if attr_line.attribute_id.custom_type == 'binary':
+                if attr_line.custom_type == 'binary':
                     # TODO: Add widget that enables multiple file uploads
                     val = [{
                         'name': 'custom',
@@ -846,14 +941,56 @@ class ProductConfigurator(models.TransientModel):
 
         self.config_session.update_config(attr_val_dict, custom_val_dict)
         res = super(ProductConfigurator, self).write(vals)
+        if 'state' in vals:
+            self._prefetch_step_prices()
         return res
 
+    def _prefetch_step_prices(self):
+        """Compute in the background the prices of the configurations
+        reachable by changing one attribute of the active step"""
+        for wiz in self:
+            if not wiz.product_tmpl_id or wiz.state == 'select':
+                continue
+            wiz.product_tmpl_id._schedule_price_prefetch(
+                wiz.value_ids.ids,
+                custom_values=wiz.config_session._get_custom_vals_dict(),
+                attr_line_ids=wiz._get_active_attr_line_ids()
+            )
+
     
     def unlink(self):
         """Remove parent model as polymorphic inheritance unlinks inheriting
            model with the parent"""
         return self.mapped('config_session').unlink()
 
+    def get_cfg_price_trace(self):
+        """Return the prices of the current configuration along with the
+        trace of their computation"""
+        self.ensure_one()
+        return self.config_session.get_cfg_price_trace()
+
+    def get_option_price_deltas(self):
+        """Return the price impact of the values selectable on the active
+        step (all steps when the wizard has none) keyed by dynamic field
+
+        :returns: dictionary {dynamic_field: {value_id: price delta}}, empty
+                  when the template does not display configured prices
+        """
+        self.ensure_one()
+        template = self.product_tmpl_id
+        if not template.config_price_display or self.state == 'select':
+            return {}
+        metadata = self._get_configurator_metadata()
+        deltas = template.get_option_price_deltas(
+            self.value_ids.ids,
+            custom_values=self.config_session._get_custom_vals_dict(),
+            attr_line_ids=self._get_active_attr_line_ids()
+        )
+        return {
+            self.field_prefix + str(line.attribute_id): deltas[line.id]
+            for line in metadata.attribute_lines if line.id in deltas
+        }
+
     
     def action_next_step(self):
         """Proceeds to the next step of the configuration process. This usually